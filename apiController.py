@@ -1,30 +1,130 @@
+import json
 import os
 import random  # 导入random模块
 import time
-from app.service.background_service import BackgroundService, WeiDianBackgroundService  # 导入后台服务模块
-from threading import Thread  # 导入线程模块
 
 from DrissionPage import ChromiumPage, ChromiumOptions
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from typing import Dict, Any
-from app.rpa.request import PlaceOrderRequest
+from app.rpa.request import PlaceOrderRequest, SmsCodeRequest
 from fastapi import Depends, HTTPException
 from sqlalchemy.orm import Session
-from app.Order.order_dao import SelfStockOrderDAO, SessionLocal
-from app.service.order_service import OrderService  # 导入订单服务
-from app.service.order_push_service import OrderPushService  # 导入新的订单推送服务
+from app.Order.order_dao import SelfStockOrderDAO, session_scope, get_pool_stats
+from app.service.order_service import OrderService, rpa_executor, job_store, close_browsers, \
+    resource_policy_stats  # 导入订单服务
+from app.service.rpa_executor import ExecutorSaturatedError
+from app.service.order_events import SMS_CODE_RECEIVED, order_events
+
+# 已发送验证码（等待验证码）和待提交的订单可以提交验证码，提交后置为待提交
+SMS_CODE_WAITING_STATUSES = (1, 201)
+SMS_CODE_READY_STATUS = 201
 
 app = FastAPI()
 
+
+@app.on_event("shutdown")
+def shutdown_browsers():
+    """API 进程退出时关闭本进程启动的浏览器"""
+    close_browsers()
+
+
+async def run_rpa(fn, request: PlaceOrderRequest) -> Dict[str, Any]:
+    """把阻塞的 RPA 流程交给 RPA 线程池执行，线程池已满时返回 429"""
+    try:
+        return await rpa_executor.run(fn, request)
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+
+
 @app.post("/api/v1/get-code")
 async def get_verification_code(request: PlaceOrderRequest) -> Dict[str, Any]:
     """获取验证码接口"""
-    return OrderService.get_verification_code(request)
+    return await run_rpa(OrderService.get_verification_code, request)
 
 @app.post("/api/v1/place-order")
 async def place_order(request: PlaceOrderRequest) -> Dict[str, Any]:
     """下单接口"""
-    return OrderService.execute_place_order(request)
+    return await run_rpa(OrderService.execute_place_order, request)
+
+@app.post("/api/v1/internal/place-order")
+async def place_order_local(request: PlaceOrderRequest) -> Dict[str, Any]:
+    """其他进程转发的下单请求（订单会话在本进程），只在本进程执行，不再转发"""
+    return await run_rpa(OrderService.execute_local_place_order, request)
+
+def submit_job(kind, fn, request: PlaceOrderRequest) -> Dict[str, Any]:
+    """提交异步任务，线程池已满时返回 429"""
+    try:
+        job = job_store.submit(kind, fn, request)
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return job.to_dict()
+
+
+def find_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+
+@app.post("/api/v1/jobs/get-code", status_code=202)
+async def submit_get_code_job(request: PlaceOrderRequest) -> Dict[str, Any]:
+    """异步获取验证码，立即返回任务ID"""
+    return submit_job("get-code", OrderService.get_verification_code, request)
+
+@app.post("/api/v1/jobs/place-order", status_code=202)
+async def submit_place_order_job(request: PlaceOrderRequest) -> Dict[str, Any]:
+    """异步下单，立即返回任务ID"""
+    return submit_job("place-order", OrderService.execute_place_order, request)
+
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0) -> Dict[str, Any]:
+    """查询任务状态，wait > 0 时长轮询，最多等待 wait 秒（上限 60 秒）"""
+    job = find_job(job_id)
+    await job_store.wait(job, min(max(wait, 0), 60))
+    return job.to_dict()
+
+@app.get("/api/v1/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """以 Server-Sent Events 推送任务状态，任务结束后推送结果并关闭连接"""
+    job = find_job(job_id)
+
+    async def event_stream():
+        status = None
+        idle = 0
+        while True:
+            if job.status != status:
+                status = job.status
+                idle = 0
+                yield f"event: status\ndata: {json.dumps({'jobId': job.id, 'status': status})}\n\n"
+            if job.finished:
+                yield f"event: result\ndata: {json.dumps(job.to_dict(), ensure_ascii=False, default=str)}\n\n"
+                return
+            # 每秒检查一次状态变化，空闲 15 秒发送一次心跳
+            await job_store.wait(job, 1)
+            idle += 1
+            if idle >= 15:
+                idle = 0
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/v1/rpa/stats")
+async def rpa_stats() -> Dict[str, Any]:
+    """RPA 线程池使用情况"""
+    return rpa_executor.stats()
+
+@app.get("/api/v1/rpa/resource-stats")
+def rpa_resource_stats() -> Dict[str, Any]:
+    """各供应商页面资源拦截统计（暂停、屏蔽的请求数和放行耗时）"""
+    return resource_policy_stats()
+
+@app.get("/api/v1/db/stats")
+def db_stats() -> Dict[str, Any]:
+    """数据库连接池使用情况"""
+    return get_pool_stats()
 
 @app.post("/api/v1/test")
 async def test():
@@ -43,7 +143,7 @@ async def test():
     co.set_argument('--ignore_https_errors')
     co.set_argument('--no-sandbox')
     co.set_argument('--disable-dev-shm-usage')
-    co.set_argument(f"--remote-debugging-port=9222")
+    co.auto_port()  # 自动分配空闲端口，避免与浏览器池冲突
     co.set_argument(f"--disable-web-security")
     co.set_argument(f"--allow-running-insecure-content")
     co.set_argument('--ignore-certificate-errors', True)
@@ -97,7 +197,7 @@ async def test():
     co.set_argument('--ignore_https_errors')
     co.set_argument('--no-sandbox')
     co.set_argument('--disable-dev-shm-usage')
-    co.set_argument(f"--remote-debugging-port=9233")
+    co.auto_port()  # 自动分配空闲端口，避免与浏览器池冲突
     co.set_argument(f"--disable-web-security")
     co.set_argument(f"--allow-running-insecure-content")
     co.set_argument('--ignore-certificate-errors', True)
@@ -219,51 +319,12 @@ async def test():
 
 # Dependency to get DB session
 def get_db():
-    db = SessionLocal()
-    try:
+    with session_scope() as db:
         yield db
-    finally:
-        db.close()
-
-
-def run_background_service():
-    """单独运行后台服务"""
-    service = BackgroundService(interval=5)
-    service.start()
-    try:
-        while True:
-            time.sleep(3)
-    except KeyboardInterrupt:
-        service.stop()
-        print("Background service stopped.")
-
-def run_weidian_background_service():
-    """单独运行后台服务"""
-    weidian_service = WeiDianBackgroundService(interval=10, order_status=101, supplier_code="weidian")
-    weidian_service.start()
-    print("微店订单处理服务已启动")
-    try:
-        while True:
-            time.sleep(3)
-    except KeyboardInterrupt:
-        weidian_service.stop()
-        print("Background service stopped.")
-
-
-def run_order_push_service():
-    """单独运行订单推送服务"""
-    push_service = OrderPushService(interval=10)
-    push_service.start()
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        push_service.stop()
-        print("Order push service stopped.")
 
 
 @app.post("/orders/status/supplier")
-async def read_orders(params: dict, db: Session = Depends(get_db)):
+def read_orders(params: dict, db: Session = Depends(get_db)):
     order_status = params.get('order_status')
     supplier_code = params.get('supplier_code')
     
@@ -271,22 +332,30 @@ async def read_orders(params: dict, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Missing required parameters")
     
     dao = SelfStockOrderDAO(db)
+    if params.get('after_id') is not None:
+        # 游标分页：返回 next_after_id 作为下一页的 after_id
+        batch_size = int(params.get('batch_size') or 100)
+        orders = dao.get_orders_page(order_status, supplier_code, int(params['after_id']), batch_size)
+        next_after_id = orders[-1].order_id if len(orders) == batch_size else None
+        return {"count": len(orders), "orders": orders, "next_after_id": next_after_id}
     orders = dao.get_orders_by_status_and_supplier(order_status, supplier_code)
     return {"count": len(orders), "orders": orders}
 
 
-if __name__ == "__main__":
-    # 启动后台服务线程
-    background_thread = Thread(target=run_background_service, daemon=True)
-    background_thread.start()
-
-    background_thread = Thread(target=run_weidian_background_service, daemon=True)
-    background_thread.start()
+@app.post("/api/v1/orders/sms-code")
+def submit_sms_code(request: SmsCodeRequest, db: Session = Depends(get_db)) -> Dict[str, Any]:
+    """提交订单短信验证码，同进程有下单服务时立即提交下单，否则由下单服务轮询处理"""
+    order = SelfStockOrderDAO(db).submit_sms_code(request.order_no, request.sms_code, SMS_CODE_WAITING_STATUSES,
+                                                  SMS_CODE_READY_STATUS)
+    if order is None:
+        raise HTTPException(status_code=409,
+                            detail=f"Order {request.order_no} not found, not waiting for SMS code or being processed")
+    dispatched = order_events.publish(SMS_CODE_RECEIVED, order)
+    return {"order_id": order.order_id, "order_no": order.order_no, "order_status": order.order_status,
+            "dispatched": dispatched}
 
-    # 启动订单推送服务线程
-    order_push_thread = Thread(target=run_order_push_service, daemon=True)
-    order_push_thread.start()
 
-    # 启动 FastAPI 服务
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5000)
+if __name__ == "__main__":
+    # API 和后台服务由进程管理器启动，崩溃自动重启；--layout split 时每个服务独立进程
+    from app.service.supervisor import main
+    main()
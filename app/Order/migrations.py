@@ -0,0 +1,90 @@
+"""
+订单库表结构迁移
+按版本号顺序执行 MIGRATIONS 中尚未执行的迁移，已执行的版本记录在 schema_migrations 表；
+多个进程同时启动时通过 MySQL 命名锁保证只有一个进程执行迁移
+
+手动执行：python -m app.Order.migrations
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, text
+
+from app.Order.order_dao import (SelfStockOrder, SelfStockOrderAttempt, SelfStockOrderClaim, SelfStockOrderSession,
+                                 engine)
+
+MIGRATION_LOCK = 'self_stock_order_migrations'
+MIGRATION_LOCK_TIMEOUT = 60
+
+_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('description', String(255)),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def _create_claim_table(conn):
+    SelfStockOrderClaim.__table__.create(conn, checkfirst=True)
+
+
+def _create_order_indexes(conn):
+    existing = {index['name'] for index in inspect(conn).get_indexes(SelfStockOrder.__tablename__)}
+    for index in SelfStockOrder.__table__.indexes:
+        if index.name not in existing:
+            print(f"Creating index {index.name} on {SelfStockOrder.__tablename__}...")
+            index.create(conn)
+
+
+def _create_attempt_table(conn):
+    SelfStockOrderAttempt.__table__.create(conn, checkfirst=True)
+
+
+def _create_session_table(conn):
+    SelfStockOrderSession.__table__.create(conn, checkfirst=True)
+
+
+# (版本号, 说明, 迁移函数)，只能追加，不能修改已发布的版本
+MIGRATIONS = [
+    (1, 'create self_stock_order_claim', _create_claim_table),
+    (2, 'add polling indexes to self_stock_order', _create_order_indexes),
+    (3, 'create self_stock_order_attempt', _create_attempt_table),
+    (4, 'create self_stock_order_session', _create_session_table),
+]
+
+
+def applied_versions(conn):
+    return {row[0] for row in conn.execute(schema_migrations.select())}
+
+
+def run_migrations(bind=engine):
+    """执行所有未执行的迁移，返回本次执行的版本号列表"""
+    applied = []
+    # 命名锁属于数据库会话，用单独的连接持有，迁移本身各自在一个事务中执行
+    with bind.connect() as lock_conn:
+        locked = lock_conn.dialect.name == 'mysql'
+        if locked and not lock_conn.execute(text("SELECT GET_LOCK(:name, :timeout)"),
+                                            {'name': MIGRATION_LOCK, 'timeout': MIGRATION_LOCK_TIMEOUT}).scalar():
+            raise RuntimeError(f"Timed out waiting for migration lock {MIGRATION_LOCK}")
+        try:
+            with bind.begin() as conn:
+                schema_migrations.create(conn, checkfirst=True)
+                done = applied_versions(conn)
+            for version, description, migrate in MIGRATIONS:
+                if version in done:
+                    continue
+                print(f"Applying migration {version}: {description}")
+                with bind.begin() as conn:
+                    migrate(conn)
+                    conn.execute(schema_migrations.insert().values(
+                        version=version, description=description, applied_at=datetime.now()))
+                applied.append(version)
+        finally:
+            if locked:
+                lock_conn.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': MIGRATION_LOCK})
+    return applied
+
+
+if __name__ == '__main__':
+    versions = run_migrations()
+    print(f"Applied migrations: {versions}" if versions else "Database schema is up to date.")
@@ -1,33 +1,226 @@
 import traceback
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
+from app.rpa.browser_pool import BrowserPool
+from app.rpa.context import OrderContext
+from app.rpa.network_dispatcher import NetworkDispatcher
+from app.rpa.replay import REPLAY_SMS, ReplayClient
 from app.rpa.request import PlaceOrderRequest
+from app.rpa.resource_policy import ResourcePolicy
+from app.rpa.session_store import DEFAULT_SESSION_TTL, SESSION_CLOSED, SESSION_OPENED, OrderSession, SessionStore
 
 
 class SupplierStrategy(ABC):
-    """供应商策略接口，每个供应商需要实现的具体操作"""
+    """供应商策略接口，每个供应商需要实现的具体操作，订单相关状态一律保存在 OrderContext 中"""
 
     @abstractmethod
-    def open_order_page(self, request: PlaceOrderRequest) -> Dict[str, Any]:
+    def open_order_page(self, ctx: OrderContext) -> Dict[str, Any]:
         """导航到下单页面"""
         pass
 
     @abstractmethod
-    def fill_phone_number(self, request: PlaceOrderRequest) -> Dict[str, Any]:
+    def fill_phone_number(self, ctx: OrderContext) -> Dict[str, Any]:
         """填写手机号"""
         pass
 
     @abstractmethod
-    def get_verification_code(self, request: PlaceOrderRequest) -> Dict[str, Any]:
+    def get_verification_code(self, ctx: OrderContext) -> Dict[str, Any]:
         """获取验证码"""
         pass
 
     @abstractmethod
-    def submit_order(self, request: PlaceOrderRequest) -> Dict[str, Any]:
+    def submit_order(self, ctx: OrderContext) -> Dict[str, Any]:
         """提交订单"""
         pass
 
+    def release_order(self, order_number):
+        """流程异常中断时释放订单占用的资源"""
+        pass
+
+    def replay_verification_code(self, ctx: OrderContext) -> Optional[Dict[str, Any]]:
+        """不经浏览器直接请求供应商接口获取验证码，返回 None 表示需要走浏览器流程"""
+        return None
+
+    def replay_submit_order(self, ctx: OrderContext) -> Optional[Dict[str, Any]]:
+        """不经浏览器直接请求供应商接口提交订单，返回 None 表示需要走浏览器流程"""
+        return None
+
+
+class BrowserSupplierStrategy(SupplierStrategy):
+    """基于浏览器池的供应商策略基类，负责按订单租用浏览器、打开和关闭标签页"""
+
+    # 提交订单能否直连；验证码发给哪个供应商会话就必须由该会话提交，提交订单只能走浏览器的供应商不能启用直连
+    replay_submit_supported = False
+
+    def __init__(self, name, pool_size=None, max_tabs_per_browser=4,
+                 session_ttl=DEFAULT_SESSION_TTL, max_sessions=None, replay=False):
+        """
+        :param name: 供应商编码
+        :param pool_size: 浏览器数量
+        :param max_tabs_per_browser: 每个浏览器最多同时打开的订单标签页
+        :param session_ttl: 订单标签页最长保留时间（秒），应与短信验证码有效期一致
+        :param max_sessions: 最多同时保留的订单标签页，默认为浏览器池容量，超出时关闭最久未使用的标签页
+        :param replay: 是否启用接口直连模式，浏览器采集到接口后直接发送 HTTP 请求
+        """
+        if replay and not self.replay_submit_supported:
+            print(f"###### 接口直连[{name}]: 提交订单只能走浏览器，不启用直连")
+            replay = False
+        self.replay = ReplayClient(name) if replay else None
+        self.pool = BrowserPool(name, self.build_options, size=pool_size,
+                                max_tabs_per_browser=max_tabs_per_browser)
+        self.sessions = SessionStore(ttl=session_ttl,
+                                     max_sessions=max_sessions or self.pool.capacity,
+                                     on_evict=self._on_session_evicted)
+        self.sessions.start_reaper()
+        self.pool.restart_listeners.append(self._on_browser_restart)
+        # 订单会话打开/关闭时回调 listener(event, supplier_code, order_id)，用于登记会话所在的进程
+        self.session_listeners = []
+        self.resource_policy = self.build_resource_policy()
+
+    @abstractmethod
+    def build_options(self):
+        """返回该供应商使用的 ChromiumOptions，端口和用户目录由浏览器池设置"""
+        pass
+
+    def build_resource_policy(self):
+        """返回订单页面的资源拦截策略，返回 None 表示不拦截"""
+        return ResourcePolicy()
+
+    def open_order_tab(self, order_id, url):
+        """从浏览器池租用一个浏览器，为订单打开标签页"""
+        # 同一订单重复获取验证码时先关闭旧标签页
+        self.close_order_tab(order_id)
+        self.sessions.make_room()
+        browser = self.pool.acquire()
+        tab = None
+        try:
+            # 先打开空白页，拦截规则和网络监听生效后再导航
+            tab = browser.new_tab()
+            if self.resource_policy is not None:
+                self.resource_policy.apply(tab)
+            browser.dispatcher.attach(tab, order_id)
+        except Exception:
+            if tab is not None:
+                tab.close()
+            self.pool.release(browser)
+            # 浏览器崩溃后立即重启，不必等待定期检查
+            if not browser.is_alive():
+                self.pool.restart(browser, "打开标签页失败")
+            raise
+        self.sessions.put(OrderSession(order_id, tab, browser))
+        self._notify_session(SESSION_OPENED, order_id)
+        tab.get(url)
+        return tab
+
+    def get_order_tab(self, order_number):
+        """
+        获取已打开的订单 tab
+        :param order_number: 订单编号
+        :return: Tab 实例或 None
+        """
+        session = self.sessions.get(order_number)
+        return session.tab if session else None
+
+    def get_order_browser(self, order_number):
+        """获取订单租用的浏览器"""
+        session = self.sessions.get(order_number)
+        return session.browser if session else None
+
+    def expect_response(self, ctx: OrderContext, pattern):
+        """登记等待订单标签页中 URL 包含 pattern 的响应，需在触发请求前调用"""
+        browser = self.get_order_browser(ctx.order_id)
+        if browser is None:
+            raise Exception(f"Tab not found for order: {ctx.order_id}")
+        return browser.dispatcher.expect(ctx.order_id, pattern)
+
+    @staticmethod
+    def wait_response(future, timeout):
+        """
+        等待 expect_response 登记的响应
+        :return: CapturedResponse，超时返回 None
+        """
+        return NetworkDispatcher.wait(future, timeout)
+
+    def ensure_order_tab(self, ctx: OrderContext):
+        """
+        获取订单标签页；直连模式下验证码可能是直接请求发送的，此时重新打开下单页面，
+        并带上直连会话的 Cookie 刷新页面，使提交订单与发送验证码处于同一个供应商会话
+        """
+        tab = self.get_order_tab(ctx.order_id)
+        if tab is None and self.replay is not None:
+            print(f"###### 接口直连: 订单 {ctx.order_id} 没有打开的页面，重新打开下单页面")
+            cookies = self.replay.order_cookies(ctx.order_id)
+            self.open_order_page(ctx)
+            tab = self.get_order_tab(ctx.order_id)
+            if tab is not None and cookies:
+                tab.set.cookies(cookies)
+                tab.refresh()
+            self.fill_phone_number(ctx)
+            tab = self.get_order_tab(ctx.order_id)
+        return tab
+
+    def replay_stage(self, ctx: OrderContext, stage, required=('phone',)):
+        """
+        直连重放某个接口
+        :param stage: 接口阶段，如 sms、submit
+        :param required: 请求中必须能替换的订单取值
+        :return: CapturedResponse，供应商的业务结果（如验证码错误）由调用方按订单结果返回，不能改走浏览器重复提交；
+                 未启用直连、没有模板、没有会话或请求失败时返回 None，由浏览器流程处理
+        """
+        if self.replay is None:
+            return None
+        if stage != REPLAY_SMS and not self.replay.has_session(ctx.order_id):
+            # 验证码是在浏览器中获取的：沿用该订单标签页的供应商会话，没有标签页时不能直连
+            tab = self.get_order_tab(ctx.order_id)
+            if tab is None or not self.replay.adopt_tab(ctx.order_id, tab):
+                return None
+        res = self.replay.replay(stage, ctx, required)
+        if res is not None:
+            print(f"###### 接口直连: {stage} 重放完成: {ctx.order_id} {res.body}")
+        return res
+
+    def harvest_replay(self, ctx: OrderContext, stage, res):
+        """浏览器流程成功后采集接口模板"""
+        if self.replay is not None and res is not None:
+            self.replay.harvest(stage, ctx, res)
+
+    def close_order_tab(self, order_number):
+        """关闭订单标签页并归还浏览器"""
+        if self.replay is not None:
+            self.replay.release(order_number)
+        session = self.sessions.pop(order_number)
+        if session is not None:
+            self._close_session(session)
+
+    def release_order(self, order_number):
+        self.close_order_tab(order_number)
+
+    def _on_browser_restart(self, browser):
+        """浏览器重启前关闭其上的所有订单会话"""
+        for session in self.sessions.pop_where(lambda s: s.browser is browser):
+            print(f"###### 浏览器重启，关闭订单会话: {session.order_id}")
+            self._close_session(session)
+
+    def _on_session_evicted(self, session, reason):
+        self._close_session(session)
+
+    def _notify_session(self, event, order_id):
+        for listener in self.session_listeners:
+            try:
+                listener(event, self.pool.name, order_id)
+            except Exception as e:
+                print(f"###### 订单会话回调异常: {order_id}: {e}")
+
+    def _close_session(self, session):
+        self._notify_session(SESSION_CLOSED, session.order_id)
+        session.browser.dispatcher.detach(session.order_id)
+        try:
+            session.tab.close()
+        except Exception as e:
+            print(f"###### 关闭订单标签页异常: {session.order_id}: {e}")
+        self.pool.release(session.browser)
+
 
 class RPABaseService:
     """RPA基础类，提供通用功能"""
@@ -39,12 +232,15 @@ class RPABaseService:
     def get_verification_code(self, request: PlaceOrderRequest) -> Dict[str, Any]:
         """执行获取验证码流程"""
         try:
-            self.strategy.open_order_page(request)
-            # 假设这里有一些通用操作
-            self.strategy.fill_phone_number(request)
-            # 等待验证码发送
-            # 这里可以添加等待逻辑或监听网络请求
-            sms_response = self.strategy.get_verification_code(request)
+            ctx = OrderContext(request)
+            sms_response = self.strategy.replay_verification_code(ctx)
+            if sms_response is None:
+                self.strategy.open_order_page(ctx)
+                # 假设这里有一些通用操作
+                self.strategy.fill_phone_number(ctx)
+                # 等待验证码发送
+                # 这里可以添加等待逻辑或监听网络请求
+                sms_response = self.strategy.get_verification_code(ctx)
             return {
                 'code': sms_response.get('code'),
                 'data': sms_response.get('responseData'),
@@ -57,6 +253,8 @@ class RPABaseService:
             }
         except Exception as e:
             print("【异常堆栈】", traceback.format_exc())
+            # 获取验证码失败，订单标签页不会再被使用
+            self.strategy.release_order(request.order_id)
             return {
                 'success': False,
                 'error': str(e),
@@ -68,7 +266,10 @@ class RPABaseService:
         try:
             # self.strategy.open_order_page(request.checkout_url)
             # self.strategy.fill_phone_number(request.phone)
-            result = self.strategy.submit_order(request)
+            ctx = OrderContext(request)
+            result = self.strategy.replay_submit_order(ctx)
+            if result is None:
+                result = self.strategy.submit_order(ctx)
             return result
         except Exception as e:
             return {
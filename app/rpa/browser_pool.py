@@ -0,0 +1,245 @@
+import os
+import socket
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from DrissionPage import ChromiumPage
+
+from app.rpa.network_dispatcher import NetworkDispatcher
+from app.rpa.target_watcher import TargetWatcher
+
+# 调试端口从这里开始向上分配，跳过已被占用的端口；多进程部署时由进程管理器为每个进程分配不同的起始端口
+DEFAULT_BASE_PORT = int(os.environ.get('RPA_BASE_PORT', 9222))
+
+_port_lock = threading.Lock()
+_reserved_ports = set()
+
+
+def _port_is_free(port):
+    """检查本机端口是否空闲"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind(('127.0.0.1', port))
+            return True
+        except OSError:
+            return False
+
+
+def reserve_port(start=DEFAULT_BASE_PORT):
+    """从 start 开始分配一个本进程内未使用且系统空闲的调试端口"""
+    with _port_lock:
+        port = start
+        while port in _reserved_ports or not _port_is_free(port):
+            port += 1
+        _reserved_ports.add(port)
+        return port
+
+
+def free_port(port):
+    """归还调试端口"""
+    with _port_lock:
+        _reserved_ports.discard(port)
+
+
+def default_pool_size():
+    """默认浏览器数量：按 CPU 核数，最多 4 个"""
+    return max(1, min(os.cpu_count() or 1, 4))
+
+
+class PooledBrowser:
+    """浏览器池中的单个 Chromium 实例，每个实例独占一个调试端口和用户目录"""
+
+    def __init__(self, pool, index, port, profile_dir):
+        self.pool = pool
+        self.index = index
+        self.port = port
+        self.profile_dir = profile_dir
+        self.active = 0  # 当前租出的标签页数量
+        self.orders_served = 0  # 启动以来承载的订单数，用于定期回收
+        self.draining = False  # 等待回收，不再租出
+        self.dispatcher = NetworkDispatcher()
+        self._page = None
+        self._targets = None
+        self._launch_lock = threading.Lock()
+
+    @property
+    def launched(self):
+        return self._page is not None
+
+    @property
+    def page(self):
+        """首次使用时才启动浏览器"""
+        if self._page is None:
+            with self._launch_lock:
+                if self._page is None:
+                    co = self.pool.options_factory()
+                    co.set_local_port(self.port)
+                    co.set_user_data_path(self.profile_dir)
+                    co.set_argument(f"--disk-cache-dir={os.path.join(self.profile_dir, 'cache')}")
+                    self._page = ChromiumPage(co, timeout=self.pool.timeout)
+                    print(f"###### 浏览器池[{self.pool.name}]: 启动浏览器 #{self.index}，端口 {self.port}")
+        return self._page
+
+    @property
+    def targets(self):
+        """浏览器级 Target 事件监听，首次使用时创建"""
+        if self._targets is None:
+            page = self.page
+            with self._launch_lock:
+                if self._targets is None:
+                    self._targets = TargetWatcher(page)
+        return self._targets
+
+    def new_tab(self, url=None):
+        return self.page.new_tab(url)
+
+    def is_alive(self, timeout=5):
+        """通过 CDP 探测浏览器是否存活，连接断开或超过 timeout 秒无响应都视为异常"""
+        page = self._page
+        if page is None:
+            return True
+        result = {}
+
+        def probe():
+            try:
+                page.run_cdp('Browser.getVersion')
+                result['ok'] = True
+            except Exception as e:
+                result['error'] = e
+
+        thread = threading.Thread(target=probe, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        return result.get('ok', False)
+
+    @property
+    def process_id(self):
+        page = self._page
+        return getattr(page, 'process_id', None) if page is not None else None
+
+    def quit(self):
+        """关闭浏览器进程"""
+        with self._launch_lock:
+            page, self._page = self._page, None
+            self._targets = None
+        if page is not None:
+            try:
+                page.quit()
+            except Exception as e:
+                print(f"###### 浏览器池[{self.pool.name}]: 关闭浏览器 #{self.index} 异常: {e}")
+
+    def __repr__(self):
+        return f"<PooledBrowser {self.pool.name}#{self.index} port={self.port} active={self.active}>"
+
+
+class BrowserPool:
+    """
+    Chromium 浏览器池
+    启动 size 个浏览器（分别使用不同的调试端口和用户目录），按订单租出负载最低的浏览器，
+    每个浏览器最多同时承载 max_tabs_per_browser 个订单标签页，用完后归还
+    """
+
+    def __init__(self, name, options_factory, size=None, max_tabs_per_browser=4,
+                 base_port=DEFAULT_BASE_PORT, profile_root=None, timeout=90):
+        """
+        :param name: 池名称，一般为供应商编码，用于区分用户目录和日志
+        :param options_factory: 无参函数，返回该供应商的 ChromiumOptions（端口和用户目录由池设置）
+        :param size: 浏览器数量，默认按 CPU 核数
+        :param max_tabs_per_browser: 每个浏览器最多同时租出的标签页数
+        :param base_port: 调试端口起始值
+        :param profile_root: 用户目录根路径，默认在系统临时目录下
+        :param timeout: ChromiumPage 超时时间
+        """
+        self.name = name
+        self.options_factory = options_factory
+        self.size = size or default_pool_size()
+        self.max_tabs_per_browser = max_tabs_per_browser
+        self.timeout = timeout
+        profile_root = profile_root or os.path.join(tempfile.gettempdir(), 'rpa_browser_pool')
+        self._cond = threading.Condition()
+        self.restart_listeners = []  # 浏览器重启前回调 listener(browser)，用于清理该浏览器上的订单会话
+        self.browsers = []
+        for index in range(self.size):
+            port = reserve_port(base_port)
+            profile_dir = os.path.join(profile_root, f"{name}_{port}")
+            os.makedirs(profile_dir, exist_ok=True)
+            self.browsers.append(PooledBrowser(self, index, port, profile_dir))
+
+    @property
+    def capacity(self):
+        """池最多可同时承载的订单数"""
+        return self.size * self.max_tabs_per_browser
+
+    @property
+    def in_use(self):
+        with self._cond:
+            return sum(browser.active for browser in self.browsers)
+
+    def _pick(self):
+        candidates = [b for b in self.browsers if b.active < self.max_tabs_per_browser and not b.draining]
+        if not candidates:
+            return None
+        # 负载最低者优先，负载相同时优先已启动的浏览器
+        return min(candidates, key=lambda b: (b.active, not b.launched, b.index))
+
+    def acquire(self, timeout=None):
+        """
+        租出一个浏览器
+        :param timeout: 池满时最多等待的秒数，None 表示一直等待
+        :return: PooledBrowser
+        """
+        with self._cond:
+            browser = self._pick()
+            if browser is None:
+                self._cond.wait_for(lambda: self._pick() is not None, timeout=timeout)
+                browser = self._pick()
+            if browser is None:
+                raise TimeoutError(f"Browser pool '{self.name}' exhausted")
+            browser.active += 1
+            browser.orders_served += 1
+        return browser
+
+    def release(self, browser):
+        """归还浏览器"""
+        with self._cond:
+            if browser.active > 0:
+                browser.active -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        browser = self.acquire(timeout)
+        try:
+            yield browser
+        finally:
+            self.release(browser)
+
+    def drain(self, browser):
+        """标记浏览器待回收，之后不再租出"""
+        with self._cond:
+            browser.draining = True
+
+    def restart(self, browser, reason=""):
+        """
+        重启浏览器：先通知监听者清理该浏览器上的订单会话，再关闭进程，下次租用时重新启动
+        active 不清零：监听者关闭会话时会归还租用，还没登记会话的订单（刚租到浏览器）流程失败后自行归还
+        """
+        print(f"###### 浏览器池[{self.name}]: 重启浏览器 #{browser.index}，原因: {reason}")
+        self.drain(browser)
+        for listener in self.restart_listeners:
+            try:
+                listener(browser)
+            except Exception as e:
+                print(f"###### 浏览器池[{self.name}]: 重启回调异常: {e}")
+        browser.quit()
+        with self._cond:
+            browser.orders_served = 0
+            browser.draining = False
+            self._cond.notify_all()
+
+    def close(self):
+        """关闭池内所有浏览器并归还端口"""
+        for browser in self.browsers:
+            browser.quit()
+            free_port(browser.port)
@@ -0,0 +1,91 @@
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:  # psutil 随 DrissionPage 安装，缺失时只做存活检查
+    psutil = None
+
+
+class BrowserSupervisor:
+    """
+    浏览器健康检查
+    定期探测池内每个已启动的浏览器：崩溃或 CDP 无响应时立即重启；
+    承载订单数超过 max_orders 或内存超过 max_rss_mb 时先停止租出，等订单全部结束后重启
+    """
+
+    def __init__(self, pools, interval=30, probe_timeout=5, max_orders=200, max_rss_mb=1500):
+        """
+        :param pools: 需要监控的 BrowserPool 列表
+        :param interval: 检查间隔（秒）
+        :param probe_timeout: CDP 探测超时（秒）
+        :param max_orders: 浏览器承载多少个订单后回收，0 表示不限制
+        :param max_rss_mb: 浏览器进程（含子进程）内存上限，0 表示不限制
+        """
+        self.pools = list(pools)
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self.max_orders = max_orders
+        self.max_rss_mb = max_rss_mb
+        self.is_running = False
+        self.thread = None
+
+    def start(self):
+        if not self.is_running:
+            self.is_running = True
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.is_running = False
+
+    def _run(self):
+        while self.is_running:
+            time.sleep(self.interval)
+            try:
+                self.check_once()
+            except Exception as e:
+                print(f"###### 浏览器监控异常: {e}")
+
+    def check_once(self):
+        for pool in self.pools:
+            for browser in pool.browsers:
+                if browser.launched:
+                    self._check(pool, browser)
+
+    def _check(self, pool, browser):
+        if not browser.is_alive(self.probe_timeout):
+            pool.restart(browser, "浏览器无响应或已崩溃")
+            return
+        if not browser.draining:
+            reason = self._recycle_reason(browser)
+            if reason:
+                print(f"###### 浏览器池[{pool.name}]: 浏览器 #{browser.index} 待回收，原因: {reason}")
+                pool.drain(browser)
+        if browser.draining and browser.active == 0:
+            pool.restart(browser, "定期回收")
+
+    def _recycle_reason(self, browser):
+        if self.max_orders and browser.orders_served >= self.max_orders:
+            return f"已承载 {browser.orders_served} 个订单"
+        rss_mb = self._rss_mb(browser)
+        if self.max_rss_mb and rss_mb and rss_mb >= self.max_rss_mb:
+            return f"内存占用 {rss_mb:.0f}MB"
+        return None
+
+    @staticmethod
+    def _rss_mb(browser):
+        """浏览器主进程及所有子进程的内存占用（MB）"""
+        if psutil is None or not browser.process_id:
+            return None
+        try:
+            process = psutil.Process(browser.process_id)
+            rss = process.memory_info().rss
+            for child in process.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except psutil.Error:
+                    pass
+            return rss / 1024 / 1024
+        except psutil.Error:
+            return None
@@ -0,0 +1,23 @@
+from app.rpa.request import PlaceOrderRequest
+
+
+class OrderContext:
+    """
+    单个订单一次 RPA 流程的上下文
+    策略对象是进程内共享的单例，订单相关的中间结果都放在这里，
+    由 RPABaseService 在每次调用时创建并依次传给策略的各个步骤
+    """
+
+    def __init__(self, request: PlaceOrderRequest):
+        self.request = request
+        self.order_id = request.order_id
+        self.sms_code = request.sms_code
+        self.tab = None
+        self.success = True
+        self.msg = ""
+        self.request_data = ""
+        self.response_data = ""
+        self.supplier_order_no = ""
+
+    def __repr__(self):
+        return f"<OrderContext order_id={self.order_id} success={self.success}>"
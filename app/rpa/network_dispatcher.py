@@ -0,0 +1,175 @@
+import base64
+import json
+import threading
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
+
+NETWORK_EVENTS = (
+    'Network.requestWillBeSent',
+    'Network.responseReceived',
+    'Network.loadingFinished',
+    'Network.loadingFailed',
+)
+
+
+def parse_body(text):
+    """JSON 内容解析为 dict/list，其余保持字符串，与 DrissionPage 监听结果保持一致"""
+    if text is None:
+        return None
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        return text
+
+
+class CapturedResponse:
+    """分发器捕获到的一次请求及其响应"""
+
+    def __init__(self, url, method, post_data, status=None, body=None, headers=None, raw_post_data=None):
+        self.url = url
+        self.method = method
+        self.post_data = post_data
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+        self.raw_post_data = raw_post_data
+
+    def __repr__(self):
+        return f"<CapturedResponse {self.method} {self.url} status={self.status}>"
+
+
+class _Expectation:
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.future = Future()
+
+
+class NetworkDispatcher:
+    """
+    网络事件分发器，每个浏览器一个，按订单登记等待的响应
+    Network 事件仍按标签页订阅：每个订单标签页打开时订阅一次并执行 Network.enable（DrissionPage 没有公开
+    按 sessionId 分发浏览器级事件的接口），不再像 tab.listen 那样每次等待都重新开启和停止监听。
+    订单通过 expect() 登记要等待的 URL 片段并拿到 Future，响应到达后由 DrissionPage 的事件线程完成 Future，
+    未被登记的请求不会读取响应体；RPA 流程是同步的，等待响应的订单仍占用一个执行线程（见 wait()）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._orders = {}        # order_id -> tab
+        self._expectations = {}  # order_id -> [_Expectation]
+        self._requests = {}      # (order_id, requestId) -> [_Expectation, CapturedResponse]
+
+    def attach(self, tab, order_id):
+        """为订单标签页订阅网络事件"""
+        with self._lock:
+            self._orders[order_id] = tab
+            self._expectations.setdefault(order_id, [])
+        driver = tab.driver
+        driver.set_callback('Network.requestWillBeSent',
+                            lambda **kw: self._on_request(order_id, kw))
+        driver.set_callback('Network.responseReceived',
+                            lambda **kw: self._on_response(order_id, kw))
+        driver.set_callback('Network.loadingFinished',
+                            lambda **kw: self._on_finished(order_id, tab, kw))
+        driver.set_callback('Network.loadingFailed',
+                            lambda **kw: self._on_failed(order_id, kw))
+        tab.run_cdp('Network.enable')
+
+    def detach(self, order_id):
+        """取消订单的订阅，未完成的等待全部取消"""
+        with self._lock:
+            tab = self._orders.pop(order_id, None)
+            expectations = self._expectations.pop(order_id, [])
+            for key in [key for key in self._requests if key[0] == order_id]:
+                del self._requests[key]
+        for expectation in expectations:
+            expectation.future.cancel()
+        if tab is None:
+            return
+        try:
+            for event in NETWORK_EVENTS:
+                tab.driver.set_callback(event, None)
+            tab.run_cdp('Network.disable')
+        except Exception:
+            # 标签页可能已经关闭
+            pass
+
+    def expect(self, order_id, pattern):
+        """
+        登记等待 URL 中包含 pattern 的下一个响应，必须在触发请求的操作之前调用
+        :return: concurrent.futures.Future，结果为 CapturedResponse
+        """
+        expectation = _Expectation(pattern)
+        with self._lock:
+            if order_id not in self._orders:
+                raise Exception(f"Order tab is not attached to dispatcher: {order_id}")
+            self._expectations[order_id].append(expectation)
+        return expectation.future
+
+    @staticmethod
+    def wait(future, timeout):
+        """等待响应，超时返回 None"""
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            return None
+
+    def _on_request(self, order_id, event):
+        url = event['request']['url']
+        with self._lock:
+            expectations = self._expectations.get(order_id)
+            if not expectations:
+                return
+            matched = next((e for e in expectations if e.pattern in url and not e.future.done()), None)
+            if matched is None:
+                return
+            expectations.remove(matched)
+            raw_post_data = event['request'].get('postData')
+            captured = CapturedResponse(url, event['request'].get('method'), parse_body(raw_post_data),
+                                        headers=event['request'].get('headers'),
+                                        raw_post_data=raw_post_data)
+            self._requests[(order_id, event['requestId'])] = [matched, captured]
+
+    def _on_response(self, order_id, event):
+        with self._lock:
+            entry = self._requests.get((order_id, event['requestId']))
+        if entry:
+            entry[1].status = event['response'].get('status')
+
+    def _on_finished(self, order_id, tab, event):
+        with self._lock:
+            entry = self._requests.pop((order_id, event['requestId']), None)
+        if not entry:
+            return
+        expectation, captured = entry
+        try:
+            result = tab.run_cdp('Network.getResponseBody', requestId=event['requestId'])
+            body = result.get('body')
+            if result.get('base64Encoded'):
+                body = base64.b64decode(body).decode('utf-8', errors='replace')
+            captured.body = parse_body(body)
+            if captured.post_data is None and captured.method == 'POST':
+                post = tab.run_cdp('Network.getRequestPostData', requestId=event['requestId'])
+                captured.raw_post_data = post.get('postData')
+                captured.post_data = parse_body(captured.raw_post_data)
+        except Exception as e:
+            print(f"###### 网络分发器: 读取响应内容失败 {captured.url}: {e}")
+        self._resolve(expectation.future, captured)
+
+    def _on_failed(self, order_id, event):
+        with self._lock:
+            entry = self._requests.pop((order_id, event['requestId']), None)
+        if entry:
+            self._resolve(entry[0].future, error=Exception(
+                f"Request failed: {entry[1].url} {event.get('errorText', '')}"))
+
+    @staticmethod
+    def _resolve(future, result=None, error=None):
+        # 等待方可能已超时取消
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
@@ -0,0 +1,209 @@
+import threading
+import time
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse, parse_qsl, quote, quote_plus
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from app.rpa.network_dispatcher import CapturedResponse, parse_body
+
+# 可重放的接口阶段
+REPLAY_SMS = 'sms'
+REPLAY_SUBMIT = 'submit'
+
+# 这些请求头由 requests 自行生成，重放时不能照搬
+SKIP_HEADERS = {'host', 'content-length', 'cookie', 'connection', 'accept-encoding'}
+
+# 太短的值（如 1、0）替换时容易误伤，不参与替换
+MIN_SUBSTITUTE_LENGTH = 4
+
+
+def order_values(ctx):
+    """订单中可在请求里替换的值：手机号、验证码、下单链接的查询参数"""
+    values = {'phone': ctx.request.phone, 'sms_code': ctx.sms_code}
+    for key, value in parse_qsl(urlparse(ctx.request.open_url or '').query):
+        values[f'query.{key}'] = value
+    return values
+
+
+class ReplayTemplate:
+    """浏览器中捕获的一次接口调用，记录当时订单的取值，重放时替换为新订单的取值"""
+
+    def __init__(self, captured: CapturedResponse, ctx):
+        self.url = captured.url
+        self.method = captured.method or 'POST'
+        self.headers = {k: v for k, v in captured.headers.items() if k.lower() not in SKIP_HEADERS}
+        self.raw_post_data = captured.raw_post_data or ''
+        self.values = order_values(ctx)
+        self.captured_at = time.time()
+
+    def render(self, ctx, required=('phone',)):
+        """
+        生成新订单的请求 URL 和请求体
+        :param required: 必须在请求中找到并替换的取值，找不到说明请求内容被加密或格式未知，不能重放
+        :return: (url, body)，模板中的订单取值无法全部对应到新订单时返回 None
+        """
+        url, body = self.url, self.raw_post_data
+        new_values = order_values(ctx)
+        for key, old in self.values.items():
+            if not old or len(old) < MIN_SUBSTITUTE_LENGTH:
+                if key in required:
+                    return None
+                continue
+            new = new_values.get(key) or ''
+            forms = [(quote_plus(old), quote_plus(new)), (quote(old, safe=''), quote(new, safe='')), (old, new)]
+            if not any(o in url or o in body for o, _ in forms):
+                if key in required:
+                    return None
+                continue
+            if not new:
+                return None
+            for old_form, new_form in forms:
+                url = url.replace(old_form, new_form)
+                body = body.replace(old_form, new_form)
+        return url, body
+
+
+class ReplayClient:
+    """
+    供应商接口直连客户端
+    浏览器完成一次完整流程后保存接口模板（只有请求，不含 Cookie），之后的订单通过连接池直接发送 HTTP 请求；
+    每个订单使用自己的 Cookie：先请求该订单的下单链接开始一个新的供应商会话，或接管该订单标签页的 Cookie，
+    同一订单的获取验证码和提交订单在同一个供应商会话中完成，不会使用其他订单的会话。
+    模板过期或请求失败后需要重新走浏览器流程采集
+    """
+
+    def __init__(self, name, pool_size=20, timeout=15, template_ttl=1200, max_orders=1000):
+        """
+        :param max_orders: 最多保留多少个订单的 Cookie，超出时丢弃最早的
+        """
+        self.name = name
+        self.timeout = timeout
+        self.template_ttl = template_ttl
+        self.max_orders = max_orders
+        # 连接池在订单间共享；Cookie 按订单单独传入，不保存在共享的 Session 上
+        self.session = requests.Session()
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._templates = {}
+        self._order_cookies = OrderedDict()  # {order_id: RequestsCookieJar}
+        self._lock = threading.Lock()
+
+    def harvest(self, stage, ctx, captured: CapturedResponse):
+        """保存浏览器中捕获的接口调用；标签页的 Cookie 属于该订单的会话，不随模板保存"""
+        if captured is None or not captured.url:
+            return
+        template = ReplayTemplate(captured, ctx)
+        with self._lock:
+            self._templates[stage] = template
+        print(f"###### 接口直连[{self.name}]: 已采集 {stage} 接口 {template.url}")
+
+    def template(self, stage):
+        with self._lock:
+            template = self._templates.get(stage)
+            if template and time.time() - template.captured_at > self.template_ttl:
+                del self._templates[stage]
+                template = None
+        return template
+
+    def invalidate(self, stage):
+        with self._lock:
+            self._templates.pop(stage, None)
+
+    def _store_cookies(self, order_id, jar):
+        with self._lock:
+            self._order_cookies.pop(order_id, None)
+            self._order_cookies[order_id] = jar
+            while len(self._order_cookies) > self.max_orders:
+                self._order_cookies.popitem(last=False)
+
+    def has_session(self, order_id):
+        """订单是否已有直连会话（验证码是直连发送的，或已接管了订单标签页的 Cookie）"""
+        with self._lock:
+            return order_id in self._order_cookies
+
+    def order_cookies(self, order_id):
+        """订单直连会话的 Cookie，格式为 [{name, value, domain, path}]，可直接设置到标签页"""
+        with self._lock:
+            jar = self._order_cookies.get(order_id)
+            return [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path} for c in jar] if jar else []
+
+    def adopt_tab(self, order_id, tab):
+        """接管订单标签页的 Cookie，后续直连请求沿用浏览器中的供应商会话"""
+        jar = requests.cookies.RequestsCookieJar()
+        try:
+            for cookie in tab.cookies():
+                jar.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+        except Exception as e:
+            print(f"###### 接口直连[{self.name}]: 读取 Cookie 失败: {e}")
+            return False
+        self._store_cookies(order_id, jar)
+        return True
+
+    def start_session(self, ctx, template):
+        """
+        为订单开始一个新的供应商会话：用空 Cookie 请求该订单的下单链接，只保存供应商为本订单下发的 Cookie
+        :return: 是否成功
+        """
+        jar = requests.cookies.RequestsCookieJar()
+        user_agent = CaseInsensitiveDict(template.headers).get('user-agent')
+        try:
+            response = self.session.get(ctx.request.open_url, cookies=jar, timeout=self.timeout,
+                                        headers={'User-Agent': user_agent} if user_agent else None)
+        except requests.exceptions.RequestException as e:
+            print(f"###### 接口直连[{self.name}]: 打开下单链接异常: {e}")
+            return False
+        if response.status_code != 200:
+            print(f"###### 接口直连[{self.name}]: 打开下单链接返回状态码 {response.status_code}")
+            return False
+        # 跳转过程中下发的 Cookie 也属于本订单的会话
+        for resp in response.history + [response]:
+            jar.update(resp.cookies)
+        self._store_cookies(ctx.order_id, jar)
+        return True
+
+    def release(self, order_id):
+        """订单流程结束，丢弃该订单的 Cookie"""
+        with self._lock:
+            self._order_cookies.pop(order_id, None)
+
+    def replay(self, stage, ctx, required=('phone',)):
+        """
+        按模板为订单直接发送请求；订单还没有直连会话时先请求下单链接开始一个新会话
+        :param required: 见 ReplayTemplate.render
+        :return: CapturedResponse（供应商的业务结果由调用方判断），无可用模板、无法建立会话或请求失败时返回 None
+        """
+        template = self.template(stage)
+        if template is None:
+            return None
+        rendered = template.render(ctx, required)
+        if rendered is None:
+            return None
+        url, body = rendered
+        if not self.has_session(ctx.order_id) and not self.start_session(ctx, template):
+            return None
+        with self._lock:
+            cookies = self._order_cookies.get(ctx.order_id)
+        if cookies is None:
+            # 会话数超过 max_orders 时刚建立的会话可能已被丢弃
+            return None
+        try:
+            response = self.session.request(template.method, url, data=body.encode('utf-8') if body else None,
+                                            headers=template.headers, cookies=cookies, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"###### 接口直连[{self.name}]: {stage} 请求异常: {e}")
+            return None
+        # 供应商下发的 Cookie 只保存到该订单
+        cookies.update(response.cookies)
+        if response.status_code != 200:
+            # 接口地址或请求格式已变化，重新走浏览器流程采集
+            print(f"###### 接口直连[{self.name}]: {stage} 返回状态码 {response.status_code}")
+            self.invalidate(stage)
+            return None
+        return CapturedResponse(url, template.method, parse_body(body), status=response.status_code,
+                                body=parse_body(response.text), headers=template.headers, raw_post_data=body)
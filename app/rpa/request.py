@@ -7,3 +7,8 @@ class PlaceOrderRequest(BaseModel):
     supplier_code: str = "drissionpage"
     order_id: str = ""
     product_code: str = ""
+
+
+class SmsCodeRequest(BaseModel):
+    order_no: str
+    sms_code: str
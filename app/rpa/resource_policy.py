@@ -0,0 +1,113 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+# 各供应商页面都用不到的资源类型（CDP Network.ResourceType）
+DEFAULT_BLOCKED_TYPES = ('Image', 'Media', 'Font')
+
+# 供应商页面上第三方（非供应商自有域名）资源中一般可以屏蔽的类型，见 ResourcePolicy.first_party_hosts
+THIRD_PARTY_BLOCKED_TYPES = ('Script', 'Stylesheet')
+
+# 统计、埋点等第三方脚本
+ANALYTICS_PATTERNS = (
+    'hm.baidu.com',
+    'cnzz.com',
+    'umeng.com',
+    'google-analytics.com',
+    'googletagmanager.com',
+    'growingio.com',
+    'sensorsdata',
+    'zhugeio.com',
+    'qiyukf.com',
+)
+
+
+class ResourcePolicy:
+    """
+    订单页面的资源加载策略，通过 CDP Fetch 拦截在页面加载前生效
+    只拦截命中屏蔽类型或屏蔽片段的请求，其余请求不会被暂停；allowed_patterns 优先于屏蔽规则。
+    设置 first_party_hosts 后，third_party_blocked_types 类型的资源只放行供应商自有域名下的请求：
+    Fetch 的 urlPattern 无法排除域名，这些类型的请求（包括供应商自有域名下的）都会先暂停，
+    自有域名的请求随后放行，每个多一次 CDP 往返。放行耗时见 stats()，对页面加载影响明显时
+    可把 third_party_blocked_types 置空
+    """
+
+    def __init__(self, blocked_types=DEFAULT_BLOCKED_TYPES, blocked_patterns=ANALYTICS_PATTERNS,
+                 allowed_patterns=(), first_party_hosts=(), third_party_blocked_types=THIRD_PARTY_BLOCKED_TYPES):
+        """
+        :param blocked_types: 屏蔽的资源类型，如 Image、Media、Font、Stylesheet
+        :param blocked_patterns: URL 包含这些片段的请求会被屏蔽
+        :param allowed_patterns: URL 包含这些片段的请求始终放行
+        :param first_party_hosts: 供应商自有域名（含子域名），如 189.cn；为空时不区分第三方资源
+        :param third_party_blocked_types: 不在 first_party_hosts 下时屏蔽的资源类型
+        """
+        self.blocked_types = tuple(blocked_types)
+        self.blocked_patterns = tuple(blocked_patterns)
+        self.allowed_patterns = tuple(allowed_patterns)
+        self.first_party_hosts = tuple(first_party_hosts)
+        self.third_party_blocked_types = tuple(third_party_blocked_types) if self.first_party_hosts else ()
+        self._lock = threading.Lock()
+        self._paused = 0
+        self._blocked = 0
+        self._continue_seconds = 0.0
+        self._max_continue_seconds = 0.0
+
+    def is_first_party(self, url):
+        host = (urlparse(url).hostname or '').lower()
+        return any(host == h or host.endswith('.' + h) for h in self.first_party_hosts)
+
+    def allows(self, url, resource_type=None):
+        if any(pattern in url for pattern in self.allowed_patterns):
+            return True
+        if resource_type in self.blocked_types:
+            return False
+        if resource_type in self.third_party_blocked_types and not self.is_first_party(url):
+            return False
+        return not any(pattern in url for pattern in self.blocked_patterns)
+
+    def _fetch_patterns(self):
+        patterns = [{'urlPattern': '*', 'resourceType': t, 'requestStage': 'Request'}
+                    for t in self.blocked_types + self.third_party_blocked_types]
+        patterns += [{'urlPattern': f'*{p}*', 'requestStage': 'Request'}
+                     for p in self.blocked_patterns]
+        return patterns
+
+    def apply(self, tab):
+        """在标签页导航前调用，开启请求拦截"""
+        patterns = self._fetch_patterns()
+        if not patterns:
+            return
+        tab.driver.set_callback('Fetch.requestPaused', lambda **kw: self._on_paused(tab, kw))
+        tab.run_cdp('Fetch.enable', patterns=patterns)
+
+    def stats(self):
+        """拦截统计：暂停的请求数、屏蔽数，以及放行请求从收到暂停事件到放行完成的平均和最大耗时（毫秒）"""
+        with self._lock:
+            continued = self._paused - self._blocked
+            return {
+                'paused': self._paused,
+                'blocked': self._blocked,
+                'continued': continued,
+                'avg_continue_ms': round(self._continue_seconds / continued * 1000, 2) if continued else 0,
+                'max_continue_ms': round(self._max_continue_seconds * 1000, 2),
+            }
+
+    def _on_paused(self, tab, event):
+        started = time.monotonic()
+        allowed = self.allows(event['request']['url'], event.get('resourceType'))
+        try:
+            if allowed:
+                tab.run_cdp('Fetch.continueRequest', requestId=event['requestId'])
+            else:
+                tab.run_cdp('Fetch.failRequest', requestId=event['requestId'], errorReason='BlockedByClient')
+        except Exception as e:
+            # 标签页关闭时暂停中的请求会失效，忽略即可
+            print(f"###### 资源拦截异常: {e}")
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._paused += 1
+            if allowed:
+                self._continue_seconds += elapsed
+                self._max_continue_seconds = max(self._max_continue_seconds, elapsed)
+            else:
+                self._blocked += 1
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+
+# 订单会话默认保留时间，与短信验证码有效期一致（秒）
+DEFAULT_SESSION_TTL = 300
+
+EVICT_EXPIRED = "expired"
+EVICT_CAPACITY = "capacity"
+
+# 会话事件，见 BrowserSupplierStrategy.session_listeners
+SESSION_OPENED = "opened"
+SESSION_CLOSED = "closed"
+
+
+class OrderSession:
+    """订单在浏览器中的会话：标签页及其所属浏览器"""
+
+    def __init__(self, order_id, tab, browser):
+        self.order_id = order_id
+        self.tab = tab
+        self.browser = browser
+        self.created_at = time.time()
+        self.last_access = self.created_at
+
+    def __repr__(self):
+        return f"<OrderSession order_id={self.order_id} browser={self.browser}>"
+
+
+class SessionStore:
+    """
+    订单会话仓库
+    会话自创建起超过 ttl 秒即过期；数量超过 max_sessions 时淘汰最久未访问的会话。
+    被淘汰的会话交给 on_evict(session, reason) 处理（关闭标签页、归还浏览器）
+    """
+
+    def __init__(self, ttl=DEFAULT_SESSION_TTL, max_sessions=50, on_evict=None, sweep_interval=30):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.on_evict = on_evict
+        self.sweep_interval = sweep_interval
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def __contains__(self, order_id):
+        return self.get(order_id) is not None
+
+    def _expired(self, session, now):
+        return now - session.created_at >= self.ttl
+
+    def put(self, session):
+        """保存会话，超出上限时淘汰最久未访问的会话"""
+        with self._lock:
+            self._sessions.pop(session.order_id, None)
+            self._sessions[session.order_id] = session
+            evicted = self._trim(self.max_sessions)
+        self._evict(evicted, EVICT_CAPACITY)
+
+    def make_room(self):
+        """为即将创建的会话腾出一个位置"""
+        with self._lock:
+            evicted = self._trim(self.max_sessions - 1)
+        self._evict(evicted, EVICT_CAPACITY)
+
+    def _trim(self, limit):
+        evicted = []
+        while len(self._sessions) > max(limit, 0):
+            _, session = self._sessions.popitem(last=False)
+            evicted.append(session)
+        return evicted
+
+    def get(self, order_id):
+        """获取会话并刷新访问顺序，已过期的会话会被淘汰"""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(order_id)
+            if session is None:
+                return None
+            if not self._expired(session, now):
+                session.last_access = now
+                self._sessions.move_to_end(order_id)
+                return session
+            del self._sessions[order_id]
+        self._evict([session], EVICT_EXPIRED)
+        return None
+
+    def pop(self, order_id):
+        """移除会话（不触发淘汰回调）"""
+        with self._lock:
+            return self._sessions.pop(order_id, None)
+
+    def pop_where(self, predicate):
+        """移除所有满足条件的会话（不触发淘汰回调）"""
+        with self._lock:
+            matched = [s for s in self._sessions.values() if predicate(s)]
+            for session in matched:
+                del self._sessions[session.order_id]
+        return matched
+
+    def sweep(self):
+        """淘汰所有过期会话"""
+        now = time.time()
+        with self._lock:
+            expired = [s for s in self._sessions.values() if self._expired(s, now)]
+            for session in expired:
+                del self._sessions[session.order_id]
+        self._evict(expired, EVICT_EXPIRED)
+        return len(expired)
+
+    def _evict(self, sessions, reason):
+        for session in sessions:
+            print(f"###### 会话淘汰: 订单 {session.order_id}，原因: {reason}")
+            if self.on_evict:
+                try:
+                    self.on_evict(session, reason)
+                except Exception as e:
+                    print(f"###### 会话淘汰回调异常: {session.order_id}: {e}")
+
+    def start_reaper(self):
+        """启动后台线程定期清理过期会话"""
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"###### 会话清理异常: {e}")
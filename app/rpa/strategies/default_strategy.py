@@ -1,13 +1,13 @@
-from apiController import PlaceOrderRequest
+from app.rpa.context import OrderContext
 from app.rpa.base import SupplierStrategy
 from typing import Dict, Any
 
 class DefaultSupplierStrategy(SupplierStrategy):
     """默认供应商策略实现示例"""
 
-    def open_order_page(self, request: PlaceOrderRequest) -> Dict[str, Any]:
+    def open_order_page(self, ctx: OrderContext) -> Dict[str, Any]:
         # 实际使用DrissionPage实现导航
-        print(f"Navigating to {request}")
+        print(f"Navigating to {ctx.request}")
         # 示例代码：self.page.get(checkout_url)
         return {
             'order_id': 'ORDER123456',
@@ -15,9 +15,9 @@ class DefaultSupplierStrategy(SupplierStrategy):
             'message': 'Order placed successfully'
         }
 
-    def fill_phone_number(self, request: PlaceOrderRequest) -> Dict[str, Any]:
+    def fill_phone_number(self, ctx: OrderContext) -> Dict[str, Any]:
         # 实际操作页面元素填写手机号
-        print(f"Filling phone number: {request}")
+        print(f"Filling phone number: {ctx.request}")
         # 示例代码：
         # self.page.ele('#phone').input(phone)
         return {
@@ -26,7 +26,7 @@ class DefaultSupplierStrategy(SupplierStrategy):
             'message': 'Order placed successfully'
         }
 
-    def get_verification_code(self, request: PlaceOrderRequest) -> Dict[str, Any]:
+    def get_verification_code(self, ctx: OrderContext) -> Dict[str, Any]:
         # 模拟从页面获取验证码（实际可能需要拦截请求）
         print("Getting verification code")
         # 示例代码：
@@ -40,9 +40,9 @@ class DefaultSupplierStrategy(SupplierStrategy):
             'message': 'Order placed successfully'
         }
 
-    def submit_order(self, request: PlaceOrderRequest) -> Dict[str, Any]:
+    def submit_order(self, ctx: OrderContext) -> Dict[str, Any]:
         # 填写验证码并提交订单
-        print(f"Submitting order with code: {request}")
+        print(f"Submitting order with code: {ctx.request}")
         # 示例代码：
         # self.page.ele('#code-input').input(code)
         # self.page.ele('#submit-order-btn').click()
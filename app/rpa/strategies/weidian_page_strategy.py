@@ -4,27 +4,25 @@ import time
 import requests
 from random import random
 from typing import Dict, Any, Optional
-from DrissionPage import ChromiumPage, ChromiumOptions
+from DrissionPage import ChromiumOptions
 from urllib.parse import urlparse, parse_qs
 from fake_useragent import UserAgent
 
 
 # 将 PlaceOrderRequest 的导入移到类内部
-from app.rpa.base import SupplierStrategy
-from app.rpa.request import PlaceOrderRequest
+from app.rpa.base import BrowserSupplierStrategy
+from app.rpa.context import OrderContext
+from app.rpa.resource_policy import ResourcePolicy
+from app.rpa.replay import REPLAY_SMS, REPLAY_SUBMIT
 
-class WeiDianPageStrategy(SupplierStrategy):
+class WeiDianPageStrategy(BrowserSupplierStrategy):
     """基于湖北的供应商策略实现基类"""
 
-    def __init__(self):
+    replay_submit_supported = True
+
+    def __init__(self, replay=False):
+        super().__init__("weidian", replay=replay)
         self.ua = None
-        self._page = None
-        self.sms_code = "123456"
-        self.response_data = ""
-        self.request_data = ""
-        self.success = True
-        self.tabs = {}
-        self.supplier_ping_zheng = ""
 
         # 初始化UserAgent，添加异常处理
         try:
@@ -152,40 +150,34 @@ class WeiDianPageStrategy(SupplierStrategy):
             print(f"Proxy test exception: {e}")
             return False
 
-    @property
-    def page(self):
-        if self._page is None:
-            browser_path = ""
-            if os.name == 'posix':  # Linux 系统
-                browser_path = r"/opt/google/chrome/google-chrome"  # 或者 "/usr/bin/chromium-browser"
-            elif os.name == 'nt':  # Windows 系统
-                browser_path = r"C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe"
-            
-            # 创建ChromiumOptions对象
-            co = ChromiumOptions().set_paths(browser_path=browser_path)
-            co.headless(False)
-            co.incognito()  # 匿名模式
-            co.set_argument('--ignore_https_errors')
-            co.set_argument('--no-sandbox')
-            co.set_argument('--disable-dev-shm-usage')
-            co.set_argument(f"--remote-debugging-port=9222")
-            co.set_argument(f"--disable-web-security")
-            co.set_argument(f"--allow-running-insecure-content")
-            co.set_argument('--ignore-certificate-errors', True)
-            co.set_argument('--disk-cache-dir=/path/to/cache')  # 指定磁盘缓存目录
-            # 禁用图片资源  主要是为了加快页面加载
-            co.set_argument('--blink-settings=imagesEnabled=false')
-            co.ignore_certificate_errors()
+    def build_resource_policy(self):
+        """下单页面和接口都在 10086.cn，其他域名的脚本和样式表流程用不到，一并屏蔽"""
+        return ResourcePolicy(first_party_hosts=('10086.cn',))
 
-            # 创建ChromiumPage对象
-            self._page = ChromiumPage(co, timeout=90)
-        return self._page
+    def build_options(self):
+        browser_path = ""
+        if os.name == 'posix':  # Linux 系统
+            browser_path = r"/opt/google/chrome/google-chrome"  # 或者 "/usr/bin/chromium-browser"
+        elif os.name == 'nt':  # Windows 系统
+            browser_path = r"C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe"
 
-    def open_order_page(self, request: PlaceOrderRequest) -> Dict[str, Any]:
-        """导航到下单页面"""
-        if not hasattr(self, 'tabs'):
-            self.tabs = {}
+        # 创建ChromiumOptions对象
+        co = ChromiumOptions().set_paths(browser_path=browser_path)
+        co.headless(False)
+        co.incognito()  # 匿名模式
+        co.set_argument('--ignore_https_errors')
+        co.set_argument('--no-sandbox')
+        co.set_argument('--disable-dev-shm-usage')
+        co.set_argument(f"--disable-web-security")
+        co.set_argument(f"--allow-running-insecure-content")
+        co.set_argument('--ignore-certificate-errors', True)
+        # 禁用图片资源  主要是为了加快页面加载
+        co.set_argument('--blink-settings=imagesEnabled=false')
+        co.ignore_certificate_errors()
+        return co
 
+    def open_order_page(self, ctx: OrderContext) -> Dict[str, Any]:
+        """导航到下单页面"""
 
         # 获取代理IP，可以传入认证信息
         # 示例：如需添加认证，可改为 self.get_proxy_ip(username='your_username', password='your_password')
@@ -204,14 +196,13 @@ class WeiDianPageStrategy(SupplierStrategy):
         # 创建新标签页前先设置请求头
         # 在DrissionPage中，我们应该在创建请求时设置headers
         # 而不是直接访问私有属性
-        tab = self.page.new_tab(request.open_url)
+        tab = ctx.tab = self.open_order_tab(ctx.order_id, ctx.request.open_url)
         # 使用标准方法设置请求头，这里假设DrissionPage支持headers属性的标准设置方式
         if hasattr(tab, 'headers'):
             tab.headers['User-Agent'] = selected_user_agent
         else:
             print(f"警告：无法设置User-Agent，标签页对象不支持headers属性")
-        self.tabs[request.order_id] = tab
-        print("###### 发送短信：2、打开站点成功：" + request.open_url)
+        print("###### 发送短信：2、打开站点成功：" + ctx.request.open_url)
 
         # 设置代理，如果获取到了代理IP
         # 代理已经在page属性初始化时通过ChromiumOptions设置
@@ -224,18 +215,10 @@ class WeiDianPageStrategy(SupplierStrategy):
             'msg': '页面访问成功'
         }
 
-    def get_order_tab(self, order_number):
-        """
-        获取已打开的订单 tab
-        :param order_number: 订单编号
-        :return: Tab 实例或 None
-        """
-        return self.tabs.get(order_number)
-
-    def fill_phone_number(self, request: PlaceOrderRequest) -> Dict[str, Any]:
-        tab = self.get_order_tab(request.order_id)
+    def fill_phone_number(self, ctx: OrderContext) -> Dict[str, Any]:
+        tab = self.get_order_tab(ctx.order_id)
         if not tab:
-            raise Exception(f"Tab not found for order: {request.order_id}")
+            raise Exception(f"Tab not found for order: {ctx.order_id}")
         # 点击立即办理按钮
         confirm_btn = tab.ele('.btnBox')
         if confirm_btn:
@@ -251,8 +234,8 @@ class WeiDianPageStrategy(SupplierStrategy):
         phone_input = tab.eles('.smsinput')[1]
         if phone_input:
             phone_input.clear()
-            phone_input.input(request.phone)
-            print(f"###### 填写手机号: 6、输入手机号成功: {request.phone}")
+            phone_input.input(ctx.request.phone)
+            print(f"###### 填写手机号: 6、输入手机号成功: {ctx.request.phone}")
         else:
             print(f"###### 填写手机号: 异常-输入框未找到，无法输入手机号")
             raise Exception("###### RPA填写手机号异常:手机号输入框未找到")
@@ -262,71 +245,118 @@ class WeiDianPageStrategy(SupplierStrategy):
         }
 
 
-    def get_verification_code(self, request: PlaceOrderRequest) -> Dict[str, Any]:
+    def get_verification_code(self, ctx: OrderContext) -> Dict[str, Any]:
         """获取验证码（通过监听网络请求），基于订单号的tab"""
-        self.success = True
-        tab = self.get_order_tab(request.order_id)
+        tab = self.get_order_tab(ctx.order_id)
         msg = ""
         if not tab:
-            raise Exception(f"Tab not found for order: {request.order_id}")
+            raise Exception(f"Tab not found for order: {ctx.order_id}")
         print("###### 发送验证码: 3、获取页面窗口成功")
-        tab.listen.start('/random.action')  # 启动监听器
+        response = self.expect_response(ctx, '/random.action')  # 登记等待的接口响应
         # 点击获取验证码按钮
         verify_code_btn = tab.ele('#id_getMessage')
         if verify_code_btn:
             verify_code_btn.click()
-            print("###### 发送验证码: 3、点击发送短信按钮: " + request.order_id)
+            print("###### 发送验证码: 3、点击发送短信按钮: " + ctx.order_id)
         else:
             print("###### 发送验证码: 异常-点击按钮失败，获取验证码按钮未找到")
             raise Exception("###### RPA发送验证码异常:获取验证码按钮未找到")
         # 等待并捕获短信请求的响应
         try:
-            res = tab.listen.wait(timeout=30)  # 等待最多10秒
-            if res and res.response:
+            res = self.wait_response(response, timeout=30)  # 等待最多10秒
+            if res:
                 # 这里需要根据实际响应格式提取验证码
                 # 假设响应中包含code字段
-                self.request_data = f"{res.request.postData}"
-                self.response_data = f"{res.response.body}"
-                print("###### 发送验证码:4、执行发送短信操作：获取返回结果" + self.response_data)
-                if  res.response.body["flag"] != '0':
-                    self.success = False
-                    tab.close()
+                ctx.request_data = f"{res.post_data}"
+                ctx.response_data = f"{res.body}"
+                print("###### 发送验证码:4、执行发送短信操作：获取返回结果" + ctx.response_data)
+                if  res.body["flag"] != '0':
+                    ctx.success = False
+                    self.close_order_tab(ctx.order_id)
+                else:
+                    self.harvest_replay(ctx, REPLAY_SMS, res)
             else:
                 print("###### 发送验证码异常:获取验证码接口返回失败")
-                self.success = False
-                self.sms_code = ""  # 默认验证码
-                tab.close()
+                ctx.success = False
+                ctx.sms_code = ""  # 默认验证码
+                self.close_order_tab(ctx.order_id)
         except Exception as e:
             print(f"###### 发送验证码: Error capturing SMS code: {e}")
-            tab.close()
-            raise Exception(f"###### 发送短信异常: 无法获取发送验证码的响应{request.order_id}")
+            self.close_order_tab(ctx.order_id)
+            raise Exception(f"###### 发送短信异常: 无法获取发送验证码的响应{ctx.order_id}")
         return {
-            'code': 200 if self.success else 500,
-            'data':  f"{self.response_data}",
+            'code': 200 if ctx.success else 500,
+            'data':  f"{ctx.response_data}",
             'msg': msg,
-            'resultLog':  f"{self.response_data}",
-            'orderNo': request.order_id,
+            'resultLog':  f"{ctx.response_data}",
+            'orderNo': ctx.order_id,
             'supplierOrderNo': '',
-            'requestData':  f"{self.request_data}",
-            'responseData': f"{self.response_data}"
+            'requestData':  f"{ctx.request_data}",
+            'responseData': f"{ctx.response_data}"
         }
 
-    def submit_order(self, request: PlaceOrderRequest) -> Dict[str, Any]:
+    def replay_verification_code(self, ctx: OrderContext) -> Optional[Dict[str, Any]]:
+        """直连模式：直接请求 /random.action 发送验证码"""
+        res = self.replay_stage(ctx, REPLAY_SMS)
+        if res is None or not isinstance(res.body, dict):
+            # 请求失败或返回的不是接口结果（如会话失效跳转的页面），改用浏览器流程
+            return None
+        ctx.request_data = f"{res.post_data}"
+        ctx.response_data = f"{res.body}"
+        if res.body.get("flag") != '0':
+            # 供应商拒绝发送验证码，与浏览器流程一样按失败返回
+            ctx.success = False
+            self.close_order_tab(ctx.order_id)
+        return {
+            'code': 200 if ctx.success else 500,
+            'data':  f"{ctx.response_data}",
+            'msg': "",
+            'resultLog':  f"{ctx.response_data}",
+            'orderNo': ctx.order_id,
+            'supplierOrderNo': '',
+            'requestData':  f"{ctx.request_data}",
+            'responseData': f"{ctx.response_data}"
+        }
+
+    def replay_submit_order(self, ctx: OrderContext) -> Optional[Dict[str, Any]]:
+        """直连模式：直接请求 /gborderNew.action 提交订单，请求中必须带有本订单的手机号和验证码"""
+        res = self.replay_stage(ctx, REPLAY_SUBMIT, required=('phone', 'sms_code'))
+        if res is None or not isinstance(res.body, dict):
+            return None
+        ctx.request_data = f"{res.post_data}"
+        ctx.response_data = f"{res.body}"
+        # 验证码错误等业务失败按订单失败返回，不能再用浏览器提交同一个验证码
+        if not res.body.get("flag"):
+            ctx.success = False
+        # 订单可能是在浏览器中获取的验证码，标签页已不再需要
+        self.close_order_tab(ctx.order_id)
+        return {
+            'code': 200 if ctx.success else 500,
+            'data':  f"{ctx.response_data}",
+            'msg': f"{ctx.response_data}",
+            'resultLog':  f"{ctx.response_data}",
+            'orderNo': ctx.order_id,
+            'supplierOrderNo': '',
+            'requestData':  f"{ctx.request_data}",
+            'responseData':  f"{ctx.response_data}"
+        }
+
+    def submit_order(self, ctx: OrderContext) -> Dict[str, Any]:
         """提交订单，基于订单号的tab"""
-        tab = self.get_order_tab(request.order_id)
+        tab = self.ensure_order_tab(ctx)
         if not tab:
-            raise Exception(f"###### 提交订单:未找到订单tab页面: {request.order_id}")
+            raise Exception(f"###### 提交订单:未找到订单tab页面: {ctx.order_id}")
 
-        print(f"提价订单: 订单数据为:  {request.order_id} - {request.sms_code}")
-        tab.listen.start('/gborderNew.action')  # 启动监听器
+        print(f"提价订单: 订单数据为:  {ctx.order_id} - {ctx.sms_code}")
+        response = self.expect_response(ctx, '/gborderNew.action')  # 登记等待的接口响应
         # 填写验证码
         code_input = tab.ele('.smsinputA')
         if code_input:
             code_input.clear()
-            code_input.input(request.sms_code)
+            code_input.input(ctx.sms_code)
         else:
-            tab.close()
-            raise Exception(f"###### 提交订单:输入验证码失败，验证码输入框未找到 {request.order_id} - {request.sms_code}")
+            self.close_order_tab(ctx.order_id)
+            raise Exception(f"###### 提交订单:输入验证码失败，验证码输入框未找到 {ctx.order_id} - {ctx.sms_code}")
         # 提交订单
         tab.ele('.btn btngo').click()
         # https: // xyy.jxschot.com / mobile - template / index.html?p = D8043BE088B8A92B1BDFF97496EA1F007F5BA585D8E5AE6655FD4B2ED9731C9D
@@ -334,33 +364,35 @@ class WeiDianPageStrategy(SupplierStrategy):
         #     'https://xyy.jxschot.com/mobile-template/index.html?p=D8043BE088B8A92B1BDFF97496EA1F007F5BA585D8E5AE6655FD4B2ED9731C9D&a=1')
         #线程休息一秒钟
         try:
-            res = tab.listen.wait(timeout=30)  # 等待最多10秒
-            if res and res.response:
+            res = self.wait_response(response, timeout=30)  # 等待最多10秒
+            if res:
                 # 这里需要根据实际响应格式提取验证码
                 # 假设响应中包含code字段
-                self.request_data = f"{res.request.postData}"
-                self.response_data = f"{res.response.body}"
-                print("###### 发送验证码:4、执行发送短信操作：获取返回结果" + self.response_data)
-                if not res.response.body["flag"]:
-                    self.success = False
-                    tab.close()
+                ctx.request_data = f"{res.post_data}"
+                ctx.response_data = f"{res.body}"
+                print("###### 发送验证码:4、执行发送短信操作：获取返回结果" + ctx.response_data)
+                if not res.body["flag"]:
+                    ctx.success = False
+                else:
+                    self.harvest_replay(ctx, REPLAY_SUBMIT, res)
             else:
                 print("###### 发送验证码异常:获取验证码接口返回失败")
-                self.success = False
-                self.sms_code = ""  # 默认验证码
-                tab.close()
+                ctx.success = False
+                ctx.sms_code = ""  # 默认验证码
         except Exception as e:
             print(f"###### 发送验证码: Error capturing SMS code: {e}")
-            tab.close()
-            raise Exception(f"###### 发送短信异常: 无法获取发送验证码的响应{request.order_id}")
+            raise Exception(f"###### 发送短信异常: 无法获取发送验证码的响应{ctx.order_id}")
+        finally:
+            # 下单流程结束，关闭订单标签页并归还浏览器
+            self.close_order_tab(ctx.order_id)
 
         return {
-            'code': 200 if self.success else 500,
-            'data':  f"{self.response_data}",
-            'msg': f"{self.response_data}",
-            'resultLog':  f"{self.response_data}",
-            'orderNo': request.order_id,
+            'code': 200 if ctx.success else 500,
+            'data':  f"{ctx.response_data}",
+            'msg': f"{ctx.response_data}",
+            'resultLog':  f"{ctx.response_data}",
+            'orderNo': ctx.order_id,
             'supplierOrderNo': '',
-            'requestData':  f"{self.request_data}",
-            'responseData':  f"{self.response_data}"
+            'requestData':  f"{ctx.request_data}",
+            'responseData':  f"{ctx.response_data}"
         }
@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import Future, InvalidStateError
+
+TARGET_EVENTS = ('Target.targetCreated', 'Target.targetInfoChanged')
+
+
+class TargetWatcher:
+    """
+    浏览器级 Target 事件监听
+    订单通过 expect() 登记 URL 条件，新页面创建或跳转到满足条件的 URL 时完成 Future，
+    不需要轮询 get_tabs() 遍历浏览器中的所有标签页
+    """
+
+    def __init__(self, page):
+        # DrissionPage 没有公开浏览器级连接，这里复用其内部 driver，并保留其原有回调
+        self._browser = page.browser
+        self._driver = self._browser._driver
+        self._lock = threading.Lock()
+        self._waiters = []  # [(predicate, Future)]
+        for event in TARGET_EVENTS:
+            previous = self._driver.event_handlers.get(event)
+            self._driver.set_callback(event, self._chain(previous))
+        self._driver.run('Target.setDiscoverTargets', discover=True)
+
+    def _chain(self, previous):
+        def callback(**kwargs):
+            if previous is not None:
+                previous(**kwargs)
+            self._on_target(kwargs.get('targetInfo') or {})
+        return callback
+
+    def expect(self, predicate):
+        """
+        登记等待 URL 满足 predicate(url) 的页面，必须在触发打开页面的操作之前调用
+        :return: Future，结果为 CDP TargetInfo（含 targetId、url）
+        """
+        future = Future()
+        with self._lock:
+            self._waiters.append((predicate, future))
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future):
+        with self._lock:
+            self._waiters = [(p, f) for p, f in self._waiters if f is not future]
+
+    def _on_target(self, info):
+        if info.get('type') != 'page':
+            return
+        url = info.get('url') or ''
+        with self._lock:
+            matched = [f for p, f in self._waiters if p(url)]
+        for future in matched:
+            try:
+                future.set_result(info)
+            except InvalidStateError:
+                pass
+
+    def close_target(self, target_id):
+        """关闭指定页面"""
+        try:
+            self._driver.run('Target.closeTarget', targetId=target_id)
+        except Exception as e:
+            print(f"###### 关闭页面异常: {target_id}: {e}")
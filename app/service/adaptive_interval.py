@@ -0,0 +1,35 @@
+class AdaptiveInterval:
+    """
+    自适应轮询间隔
+    查询结果为空时间隔按 backoff 倍数递增直到 max_interval；查到满批订单时降到 min_interval 连续拉取；
+    查到部分订单或本轮未查询时回到基础间隔
+    """
+
+    def __init__(self, interval, min_interval=0.5, max_interval=60, backoff=2.0):
+        """
+        :param interval: 基础间隔（秒）
+        :param min_interval: 满批时的间隔
+        :param max_interval: 空闲时的最大间隔
+        :param backoff: 空闲时每轮间隔的放大倍数
+        """
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+        self.backoff = backoff
+        self.current = self.interval
+
+    def next(self, fetched, batch_size):
+        """
+        根据本轮查询到的订单数计算下次轮询前的等待时间
+        :param fetched: 本轮查询到的订单数，None 表示本轮未查询（异常或处理线程已满）
+        :param batch_size: 每轮最多查询的订单数
+        """
+        if fetched is None:
+            self.current = self.interval
+        elif fetched == 0:
+            self.current = min(max(self.current, self.interval) * self.backoff, self.max_interval)
+        elif fetched >= batch_size:
+            self.current = self.min_interval
+        else:
+            self.current = self.interval
+        return self.current
@@ -1,49 +1,144 @@
 
 import threading
 import time
-from app.Order.order_dao import SelfStockOrderDAO
-from app.Order.order_dao import SessionLocal
+from app.Order.migrations import run_migrations
+from app.Order.order_dao import ClaimStage, SelfStockOrderDAO, claim_owner
+from app.Order.order_dao import session_scope
 from app.rpa.request import PlaceOrderRequest
-from app.service.order_service import OrderService
-from collections import defaultdict
+from app.service.adaptive_interval import AdaptiveInterval
+from app.service.order_deadline import ORDER_EXPIRED_MESSAGE, ORDER_TTL, deadline_key, expire_before, is_expired
+from app.service.order_service import OrderService, free_sessions, order_worker_pool, status_writer
+from app.service.product_scheduler import ProductRateScheduler
+from app.service.retry_policy import RetryPolicy
+from app.service.scheduler_state import SchedulerStateStore, default_state_path
 
 
 class BaseBackgroundService:
-    def __init__(self, interval=5, order_status=101, supplier_code=""):
+    def __init__(self, interval=5, order_status=101, supplier_code="", min_interval=0.5, max_interval=60,
+                 batch_size=10, order_ttl=ORDER_TTL):
         self.interval = interval
+        # 轮询间隔随查询结果自适应：空闲时逐步放大，满批时连续拉取
+        self.poll_interval = AdaptiveInterval(interval, min_interval, max_interval)
+        # 每轮最多认领的订单数
+        self.batch_size = batch_size
         self.is_running = False
         self.thread = None
         self.cached_orders = {}  # 缓存订单数据，格式为 {supplier_code: orders}
         self.default_order_status = order_status
         self.default_supplier_code = supplier_code
+        # 订单认领者标识和租约时长，多个进程共享订单表时避免重复处理
+        self.claim_owner = claim_owner(f"{self.__class__.__name__}-{supplier_code}")
+        self.lease_seconds = 600
+        # 订单并行处理线程池（各服务共享，按供应商限制并发）
+        self.worker_pool = order_worker_pool
+        # 订单状态批量回写（各服务共享）
+        self.status_writer = status_writer
+        # 订单自下单起超过 order_ttl 秒未处理即超时，置为 expired_status 不再占用浏览器；0 表示不超时（默认，见 RPA_ORDER_TTL）
+        self.order_ttl = order_ttl
+        self.expired_status = 4
+        self.expire_interval = 60
+        self._last_expire = 0
+        # 处理异常的订单按指数退避重试，多次失败后置为失败状态
+        self.retry_policy = RetryPolicy(failed_status=4)
 
-    def start(self):
-        """Start the background service."""
+    def start(self, poll=True):
+        """Start the background service. With poll=False orders are fed by UnifiedOrderPoller instead."""
         if not self.is_running:
+            if poll:
+                try:
+                    run_migrations()
+                except Exception as e:
+                    print(f"Failed to run database migrations: {e}")
             self.is_running = True
-            self.thread = threading.Thread(target=self._run)
-            self.thread.daemon = True  # Daemonize thread
-            self.thread.start()
+            if poll:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True  # Daemonize thread
+                self.thread.start()
 
     def stop(self):
         """Stop the background service."""
         self.is_running = False
+        try:
+            self.status_writer.flush()
+        except Exception as e:
+            print(f"Failed to flush order statuses: {e}")
 
     def _run(self):
         """The actual task to be executed periodically."""
         while self.is_running:
+            fetched, limit = None, self.batch_size
             try:
-                self.execute_task()
+                fetched, limit = self.execute_task()
             except Exception as e:
                 print(f"Error in background task: {e}")
-            time.sleep(self.interval)
+            time.sleep(self.poll_interval.next(fetched, limit))
 
     def execute_task(self):
-        """Override this method with your custom logic."""
-        raise NotImplementedError("Subclasses must implement execute_task()")
+        """
+        认领一批订单并分发处理
+        :return: (认领到的订单数, 本轮最多认领数)；本轮未查询时订单数为 None
+        """
+        stage = self.claim_stage()
+        if stage is None:
+            print(f"#### 供应商 {self.default_supplier_code} 处理线程已满，跳过本次查询.")
+            return None, self.batch_size
+        with session_scope() as db:
+            dao = SelfStockOrderDAO(db)
+            self.prepare(dao)
+            orders = dao.claim_orders_for_stages([stage], self.lease_seconds)[0]
+        self.dispatch(orders)
+        return len(orders), stage.limit
+
+    def claim_stage(self):
+        """本轮的认领条件：只认领有空闲线程和空闲会话处理的订单，没有空位时返回 None"""
+        slots = self.worker_pool.free_slots(self.default_supplier_code)
+        sessions = free_sessions(self.default_supplier_code)
+        if sessions is not None:
+            # 获取验证码会打开新的订单标签页，并一直占用到提交订单；正在处理的订单可能还没打开标签页，一并扣除
+            slots = min(slots, sessions - self.worker_pool.running(self.default_supplier_code))
+        if slots <= 0:
+            return None
+        return ClaimStage(self.default_order_status, self.default_supplier_code, self.claim_owner,
+                          min(slots, self.batch_size), expire_before(self.order_ttl))
+
+    def prepare(self, dao):
+        """认领前的维护：批量置超时订单"""
+        self.expire_stale_orders(dao)
+
+    def dispatch(self, orders):
+        """认领到的订单交给线程池并行处理"""
+        print(f"#### 执行订单数为: {len(orders)} ，供应商策略为: {self.default_supplier_code}.")
+        for order in orders:
+            if self.worker_pool.try_submit(self.default_supplier_code, self.handle_order, order) is None:
+                # 其他服务占用了空位，释放认领等待下次查询
+                self.release_claim(order)
+
+    def handle_order(self, order):
+        """处理单个订单，默认发送短信"""
+        self.send_sms_for_order(order)
+
+    def expire_stale_orders(self, dao):
+        """每 expire_interval 秒把未认领的超时订单批量置为超时状态"""
+        if not self.order_ttl or time.time() - self._last_expire < self.expire_interval:
+            return
+        self._last_expire = time.time()
+        count = dao.expire_orders(self.default_order_status, self.default_supplier_code,
+                                  expire_before(self.order_ttl), self.expired_status, ORDER_EXPIRED_MESSAGE)
+        if count:
+            print(f"#### 供应商 {self.default_supplier_code} 有 {count} 个订单已超时")
+
+    def fail_if_expired(self, order):
+        """订单已超时则直接置为超时状态，返回 True"""
+        if not is_expired(order, self.order_ttl):
+            return False
+        print(f"###### 订单 {order.order_no} 已超时，放弃处理")
+        self.status_writer.write(order.order_id, self.expired_status, ORDER_EXPIRED_MESSAGE, self.claim_owner)
+        return True
 
     def send_sms_for_order(self, order):
         """调用 OrderService 发送短信，并在成功后更新订单状态"""
+        if self.fail_if_expired(order):
+            return
         print(f"###### 1、准备开发发送短信: {order.order_no}, {order.phone}")
         
         # 构造请求对象
@@ -59,60 +154,58 @@ class BaseBackgroundService:
         try:
             # 调用验证码接口
             response = OrderService.get_verification_code(request)
-            db = SessionLocal()
-            dao = SelfStockOrderDAO(db)
-            # 验证码发送成功后更新订单状态为 102
-            dao.update_order_status_by_id(order.order_id, 1 if response.get("code") == 200 else 4,  response.get("msg"))
+            if 'error' in response:
+                # 流程异常（页面元素缺失、超时等），退避后重试
+                print(f"###### 发送短信流程异常: {order.order_no}: {response['error']}")
+                self.record_failure(order, response['error'])
+                return
+            # 验证码发送成功后更新订单状态为 102（批量回写，写回后释放认领）
+            self.status_writer.write(order.order_id, 1 if response.get("code") == 200 else 4, response.get("msg"),
+                                     self.claim_owner)
         except Exception as e:
             print(f"###### 发送短信异常: {order.order_no}: {e}")
+            self.record_failure(order, e)
 
+    def release_claim(self, order):
+        """释放订单认领（随下一批状态回写提交）"""
+        self.status_writer.release(order.order_id, self.claim_owner)
 
-class BackgroundService(BaseBackgroundService):
-    """原有的定时任务服务，处理普通订单"""
-    def __init__(self, interval=5, order_status=101, supplier_code="hubei-dianxin"):
-        super().__init__(interval, order_status, supplier_code)
-
-    def execute_task(self):
-        """执行发送短信任务"""
-        print("#### 执行发送短信任务.")
-        db = SessionLocal()
-        try:
-            dao = SelfStockOrderDAO(db)
-            # 使用传入的状态和供应商代码查询订单
-            orders = dao.get_orders_by_status_and_supplier(
-                self.default_order_status, self.default_supplier_code
-            )
-            print(f"#### 执行订单数为: {len(orders)} ，供应商策略为: {self.default_supplier_code}.")
+    def record_failure(self, order, error):
+        """记录处理失败并释放认领，订单在退避时间过后才会被重新认领"""
+        self.status_writer.fail(order.order_id, order.order_status, error, self.retry_policy, self.claim_owner)
 
-            # 遍历订单并发送短信
-            for order in orders:
-                self.send_sms_for_order(order)
 
-        finally:
-            db.close()
+class BackgroundService(BaseBackgroundService):
+    """原有的定时任务服务，处理普通订单"""
+    def __init__(self, interval=5, order_status=101, supplier_code="hubei-dianxin", min_interval=0.5,
+                 max_interval=60, order_ttl=ORDER_TTL):
+        super().__init__(interval, order_status, supplier_code, min_interval, max_interval, order_ttl=order_ttl)
 
 
 class WeiDianBackgroundService(BaseBackgroundService):
     """微店订单处理服务 - 实现订单队列和商品级别限流"""
-    def __init__(self, interval=5, order_status=101, supplier_code="weidian"):
-        super().__init__(interval, order_status, supplier_code)
-        # 按商品分组的订单队列
-        self.order_queues = defaultdict(list)
+    def __init__(self, interval=5, order_status=101, supplier_code="weidian",
+                 rate_limit_interval=60, product_intervals=None, state_path=None, min_interval=0.5,
+                 max_interval=60, order_ttl=ORDER_TTL):
+        super().__init__(interval, order_status, supplier_code, min_interval, max_interval, order_ttl=order_ttl)
+        # 按商品分组的订单队列及限流调度，rate_limit_interval 为默认间隔（秒），product_intervals 按商品单独配置；
+        # 同一商品内截止时间最早的订单先处理
+        self.scheduler = ProductRateScheduler(rate_limit_interval, product_intervals,
+                                              priority=lambda order: deadline_key(order, self.order_ttl))
+        # 限流时间和排队订单持久化到本地文件（默认在 RPA_STATE_DIR 下），重启后恢复
+        self.state = SchedulerStateStore(state_path or default_state_path(f"{supplier_code}_scheduler_state.db"))
         # 记录队列中已存在的订单号，避免重复添加
         self.queued_orders = set()
         # 记录当前正在处理的订单
         self.processing_orders = set()
-        # 记录每个商品的上次处理时间
-        self.product_last_process_time = defaultdict(float)
-        # 限流时间间隔（秒）
-        self.rate_limit_interval = 60
         # 用于控制订单处理线程
         self.processing_thread = None
         self.processing_is_running = False
 
-    def start(self):
+    def start(self, poll=True):
         """启动微店订单服务，包括查询服务和处理服务"""
-        super().start()
+        self._restore_state()
+        super().start(poll)
         # 启动订单处理线程
         self.processing_is_running = True
         self.processing_thread = threading.Thread(target=self._process_orders_worker)
@@ -125,115 +218,142 @@ class WeiDianBackgroundService(BaseBackgroundService):
         super().stop()
         # 停止订单处理线程
         self.processing_is_running = False
+        self.scheduler.interrupt()
         if self.processing_thread:
             self.processing_thread.join(timeout=2.0)
         print("微店订单处理服务已停止")
 
-    def execute_task(self):
-        """执行微店订单查询任务 - 查询最近100条订单并加入队列"""
-        current_time = time.time()
-        print(f"#### 执行微店订单查询任务，当前时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(current_time))}")
-        
-        db = SessionLocal()
+    def _restore_state(self):
+        """恢复上次运行时的限流时间和排队订单"""
         try:
-            dao = SelfStockOrderDAO(db)
-            # 查询微店待处理订单
-            orders = dao.get_orders_by_status_and_supplier(
-                self.default_order_status,
-                self.default_supplier_code
-            )
-            
-            print(f"#### 查询到 {len(orders)} 个微店待处理订单")
-            
-            # 添加新订单到队列
-            added_count = 0
-            for order in orders:
-                if order.order_no not in self.queued_orders and order.order_no not in self.processing_orders:
-                    # 按商品分组加入队列
-                    self.order_queues[order.goods_code].append(order)
+            # 沿用上次的认领者标识，排队订单的认领可以直接续租
+            owner = self.state.get_owner()
+            if owner:
+                self.claim_owner = owner
+            else:
+                self.state.set_owner(self.claim_owner)
+            self.scheduler.restore(self.state.load_next_at())
+            queued_ids = self.state.load_queued_ids()
+            if not queued_ids:
+                return
+            with session_scope() as db:
+                orders = SelfStockOrderDAO(db).claim_orders_by_ids(
+                    queued_ids, self.default_order_status, self.claim_owner, self.lease_seconds)
+            by_id = {order.order_id: order for order in orders}
+            for order_id in queued_ids:
+                order = by_id.get(order_id)
+                if order and order.order_no not in self.queued_orders:
                     self.queued_orders.add(order.order_no)
-                    added_count += 1
-                    print(f"#### 订单 {order.order_no} (商品 {order.goods_code}) 已加入队列")
-                else:
-                    print(f"#### 订单 {order.order_no} 已在队列或处理中，跳过添加")
-            
-            # 打印队列状态
-            self._print_queue_status()
-            print(f"#### 本次查询完成，新添加 {added_count} 个订单到队列")
-            
+                    self.scheduler.add(order.goods_code, order)
+            # 已处理或被其他进程认领的订单不再恢复
+            self.state.remove_orders([order_id for order_id in queued_ids if order_id not in by_id])
+            print(f"#### 已恢复 {len(by_id)}/{len(queued_ids)} 个排队订单")
         except Exception as e:
-            print(f"#### 执行订单查询任务时发生异常: {e}")
-        finally:
-            db.close()
-    
+            print(f"#### 恢复订单队列状态异常: {e}")
+
+    def claim_stage(self):
+        """微店订单进入限流队列，每轮最多认领 batch_size 个"""
+        return ClaimStage(self.default_order_status, self.default_supplier_code, self.claim_owner,
+                          self.batch_size, expire_before(self.order_ttl))
+
+    def prepare(self, dao):
+        """认领前的维护：超时订单出队，排队订单续租"""
+        self.expire_stale_orders(dao)
+        # 排队期间已超时的订单移出队列
+        self._drop_expired_queued()
+        # 队列中的订单等待限流期间续租，避免被其他进程重新认领
+        waiting_ids = [o.order_id for o in self.scheduler.items()]
+        dao.renew_claims(waiting_ids, self.claim_owner, self.lease_seconds)
+
+    def dispatch(self, orders):
+        """认领到的订单按商品加入限流队列"""
+        print(f"#### 查询到 {len(orders)} 个微店待处理订单")
+
+        # 添加新订单到队列
+        added_count = 0
+        for order in orders:
+            if order.order_no not in self.queued_orders and order.order_no not in self.processing_orders:
+                # 按商品分组加入队列
+                self.queued_orders.add(order.order_no)
+                self.state.add_order(order)
+                self.scheduler.add(order.goods_code, order)
+                added_count += 1
+                print(f"#### 订单 {order.order_no} (商品 {order.goods_code}) 已加入队列")
+            else:
+                print(f"#### 订单 {order.order_no} 已在队列或处理中，跳过添加")
+
+        # 打印队列状态
+        self._print_queue_status()
+        print(f"#### 本次查询完成，新添加 {added_count} 个订单到队列")
+
+    def _drop_expired_queued(self):
+        expired = self.scheduler.remove_where(lambda order: is_expired(order, self.order_ttl))
+        if not expired:
+            return
+        for order in expired:
+            self.queued_orders.discard(order.order_no)
+            self.fail_if_expired(order)
+        self.state.remove_orders([order.order_id for order in expired])
+
     def _process_orders_worker(self):
-        """订单处理工作线程 - 持续监听队列并按限流规则处理订单"""
+        """订单处理工作线程 - 阻塞等待下一个可处理的商品，按限流规则处理订单"""
         print("微店订单处理工作线程已启动")
         
         while self.processing_is_running:
             try:
-                current_time = time.time()
-                
-                # 对每个商品队列检查并处理订单
-                for product_code in list(self.order_queues.keys()):
-                    # 检查是否可以处理该商品的订单
-                    if self._can_process_product(product_code, current_time) and self.order_queues[product_code]:
-                        # 从队列中取出第一个订单
-                        order = self.order_queues[product_code].pop(0)
-                        
-                        # 从队列记录中移除，但添加到处理中记录
-                        self.queued_orders.remove(order.order_no)
-                        self.processing_orders.add(order.order_no)
-                        
-                        print(f"#### 从队列取出商品 {product_code} 的订单 {order.order_no} 进行处理")
-                        
-                        try:
-                            # 处理订单
-                            self.process_weidian_order(order)
-                            # 更新该商品的最后处理时间
-                            self.product_last_process_time[product_code] = current_time
-                            print(f"#### 商品 {product_code} 的订单 {order.order_no} 处理完成")
-                        finally:
-                            # 无论成功失败，都从处理中集合移除
-                            self.product_last_process_time[product_code] = current_time
-                            self.processing_orders.remove(order.order_no)
-                
+                # 睡眠到最早可处理的商品到期，取出该商品队首订单
+                entry = self.scheduler.take()
+                if entry is None:
+                    continue
+                product_code, order = entry
+                # 先记录限流时间，重启后不会对同一商品立即重复下单
+                self._persist_taken(product_code, order)
+
+                # 从队列记录中移除，但添加到处理中记录
+                self.queued_orders.discard(order.order_no)
+                self.processing_orders.add(order.order_no)
+
+                print(f"#### 从队列取出商品 {product_code} 的订单 {order.order_no} 进行处理")
+
+                try:
+                    # 处理订单
+                    self.process_weidian_order(order)
+                    print(f"#### 商品 {product_code} 的订单 {order.order_no} 处理完成")
+                finally:
+                    # 无论成功失败，都从处理中集合移除
+                    self.processing_orders.discard(order.order_no)
+
                 # 打印队列状态
                 self._print_queue_status()
                 
-                # 短暂休眠避免CPU占用过高
-                time.sleep(1)
-                
             except Exception as e:
                 print(f"#### 订单处理工作线程异常: {e}")
                 time.sleep(2)  # 异常后等待更长时间再重试
     
-    def _can_process_product(self, product_code, current_time):
-        """检查是否可以处理指定商品的订单"""
-        last_process_time = self.product_last_process_time.get(product_code, 0)
-        can_process = (current_time - last_process_time) >= self.rate_limit_interval
-        if not can_process:
-            remaining_time = self.rate_limit_interval - (current_time - last_process_time)
-            print(f"#### 商品 {product_code} 还需等待 {remaining_time:.1f} 秒才能处理下一订单")
-        return can_process
-    
+    def _persist_taken(self, product_code, order):
+        try:
+            self.state.save_next_at(product_code, self.scheduler.next_at(product_code))
+            self.state.remove_orders([order.order_id])
+        except Exception as e:
+            print(f"#### 保存限流状态异常: {e}")
+
     def _print_queue_status(self):
         """打印队列状态信息"""
-        total_orders = sum(len(queue) for queue in self.order_queues.values())
-        product_count = len([code for code in self.order_queues.keys() if self.order_queues[code]])
+        sizes = self.scheduler.sizes()
         
         print(f"===== 队列状态 =====")
-        print(f"总订单数: {total_orders}")
-        print(f"有订单的商品数: {product_count}")
+        print(f"总订单数: {sum(sizes.values())}")
+        print(f"有订单的商品数: {len(sizes)}")
         
-        for product_code, queue in self.order_queues.items():
-            if queue:
-                print(f"商品 {product_code}: {len(queue)} 个订单")
+        for product_code, size in sizes.items():
+            print(f"商品 {product_code}: {size} 个订单")
         print(f"处理中的订单数: {len(self.processing_orders)}")
         print(f"==================")
         
     def process_weidian_order(self, order):
         """处理单个微店订单"""
+        if self.fail_if_expired(order):
+            return
         print(f"###### 微店订单处理: 开始处理订单 {order.order_no}, 商品 {order.goods_code}")
         
         # 构造请求对象
@@ -248,12 +368,17 @@ class WeiDianBackgroundService(BaseBackgroundService):
         try:
             # 调用验证码接口
             response = OrderService.get_verification_code(request)
-            db = SessionLocal()
-            dao = SelfStockOrderDAO(db)
-            # 验证码发送成功后更新订单状态为 102
-            dao.update_order_status_by_id(order.order_id, 1 if response.get("code") == 200 else 4,  response.get("msg"))
+            if 'error' in response:
+                # 流程异常（页面元素缺失、超时等），退避后重试
+                print(f"###### 发送短信流程异常: {order.order_no}: {response['error']}")
+                self.record_failure(order, response['error'])
+                return
+            # 验证码发送成功后更新订单状态为 102（批量回写，写回后释放认领）
+            self.status_writer.write(order.order_id, 1 if response.get("code") == 200 else 4, response.get("msg"),
+                                     self.claim_owner)
         except Exception as e:
             print(f"###### 发送短信异常: {order.order_no}: {e}")
+            self.record_failure(order, e)
 
 
 # 使用示例
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+import uuid
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class Job:
+    """一次异步执行的 RPA 任务（获取验证码 / 下单）"""
+
+    def __init__(self, kind, order_id):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.order_id = order_id
+        self.status = JOB_PENDING
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+
+    @property
+    def finished(self):
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    def to_dict(self):
+        return {
+            'jobId': self.id,
+            'kind': self.kind,
+            'orderNo': self.order_id,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'createdAt': self.created_at,
+            'finishedAt': self.finished_at,
+        }
+
+
+class JobStore:
+    """
+    异步任务仓库
+    提交时立即返回任务，RPA 流程在 RPAExecutor 中执行，结果保存 ttl 秒供轮询 / 长轮询 / SSE 获取
+    """
+
+    def __init__(self, executor, ttl=600):
+        self.executor = executor
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, request):
+        """
+        提交任务
+        :raises ExecutorSaturatedError: RPA 执行器已满
+        """
+        self._prune()
+        job = Job(kind, request.order_id)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            job.future = self.executor.submit(self._execute, job, fn, request)
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+        return job
+
+    @staticmethod
+    def _execute(job, fn, request):
+        job.status = JOB_RUNNING
+        try:
+            job.result = fn(request)
+            job.status = JOB_DONE
+        except Exception as e:
+            job.error = str(getattr(e, 'detail', e))
+            job.status = JOB_FAILED
+        finally:
+            job.finished_at = time.time()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    async def wait(self, job, timeout):
+        """异步等待任务结束，超时后直接返回当前状态"""
+        if job.finished or not timeout:
+            return job
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.future)), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    def _prune(self):
+        """清理过期的已完成任务"""
+        expire_before = time.time() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < expire_before]
+            for job_id in expired:
+                del self._jobs[job_id]
@@ -0,0 +1,38 @@
+import os
+from datetime import datetime, timedelta
+
+# 订单超时后写回的提示信息
+ORDER_EXPIRED_MESSAGE = "订单已超时，放弃处理"
+
+# 发送验证码阶段：订单自下单起超过该秒数未处理即超时；默认 0 不超时
+ORDER_TTL = int(os.environ.get('RPA_ORDER_TTL', 0))
+# 提交订单阶段：验证码到达后超过该秒数未提交即超时（验证码已失效）；默认 0 不超时
+SMS_CODE_TTL = int(os.environ.get('RPA_SMS_CODE_TTL', 0))
+
+# 计算截止时间的起点字段：下单时间；验证码到达时间（提交验证码时写入的 update_time）
+EXPIRE_FROM_ORDER_TIME = 'order_time'
+EXPIRE_FROM_SMS_CODE = 'update_time'
+
+
+def order_deadline(order, ttl, since=EXPIRE_FROM_ORDER_TIME):
+    """订单截止时间：起点字段 since 的时间 + ttl 秒；没有起点时间或 ttl 为 0 时没有截止时间"""
+    started_at = getattr(order, since)
+    if not ttl or started_at is None:
+        return None
+    return started_at + timedelta(seconds=ttl)
+
+
+def is_expired(order, ttl, now=None, since=EXPIRE_FROM_ORDER_TIME):
+    deadline = order_deadline(order, ttl, since)
+    return deadline is not None and deadline <= (now or datetime.now())
+
+
+def deadline_key(order, ttl, since=EXPIRE_FROM_ORDER_TIME):
+    """按截止时间排序的键，越早截止越靠前，没有截止时间的排在最后"""
+    deadline = order_deadline(order, ttl, since)
+    return deadline.timestamp() if deadline else float('inf')
+
+
+def expire_before(ttl, now=None):
+    """起点时间早于该时间的订单已超时；ttl 为 0 时返回 None"""
+    return (now or datetime.now()) - timedelta(seconds=ttl) if ttl else None
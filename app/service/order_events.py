@@ -0,0 +1,46 @@
+import threading
+
+# 订单验证码已写入、可以提交下单，参数为订单（已与 session 分离）
+SMS_CODE_RECEIVED = 'sms_code_received'
+
+
+class OrderEventBus:
+    """
+    进程内订单事件
+    验证码到达后直接通知同进程的下单服务立即提交，不必等下一轮轮询；
+    没有订阅者（如服务运行在其他进程）时订单仍由轮询处理
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, event, handler):
+        with self._lock:
+            handlers = self._handlers.setdefault(event, [])
+            if handler not in handlers:
+                handlers.append(handler)
+
+    def unsubscribe(self, event, handler):
+        with self._lock:
+            handlers = self._handlers.get(event, [])
+            if handler in handlers:
+                handlers.remove(handler)
+
+    def publish(self, event, payload):
+        """
+        依次通知订阅者，某个订阅者返回 True（已接手处理）后不再通知其他订阅者
+        :return: 是否有订阅者接手处理
+        """
+        with self._lock:
+            handlers = list(self._handlers.get(event, []))
+        for handler in handlers:
+            try:
+                if handler(payload):
+                    return True
+            except Exception as e:
+                print(f"Failed to handle order event {event}: {e}")
+        return False
+
+
+order_events = OrderEventBus()
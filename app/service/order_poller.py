@@ -0,0 +1,70 @@
+import threading
+import time
+
+from app.Order.migrations import run_migrations
+from app.Order.order_dao import SelfStockOrderDAO, session_scope
+from app.service.adaptive_interval import AdaptiveInterval
+
+
+class UnifiedOrderPoller:
+    """
+    统一订单轮询
+    每轮用一个数据库会话、一条认领查询同时为所有处理阶段（订单状态 + 供应商）认领订单，
+    再分发给各阶段的服务处理；各服务以 start(poll=False) 启动，不再单独轮询。
+    服务需实现 claim_stage()、prepare(dao)、dispatch(orders)，新增供应商只需注册一个服务
+    """
+
+    def __init__(self, services, interval=5, min_interval=0.5, max_interval=60, lease_seconds=600):
+        self.services = list(services)
+        self.interval = interval
+        self.poll_interval = AdaptiveInterval(interval, min_interval, max_interval)
+        self.lease_seconds = lease_seconds
+        self.is_running = False
+        self.thread = None
+
+    def start(self):
+        if not self.is_running:
+            try:
+                run_migrations()
+            except Exception as e:
+                print(f"Failed to run database migrations: {e}")
+            for service in self.services:
+                service.start(poll=False)
+            self.is_running = True
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+            print(f"统一订单轮询已启动，处理阶段: "
+                  f"{', '.join(f'{s.default_supplier_code}/{s.default_order_status}' for s in self.services)}")
+
+    def stop(self):
+        self.is_running = False
+        for service in self.services:
+            service.stop()
+
+    def _run(self):
+        while self.is_running:
+            fetched, batch_size = None, 1
+            try:
+                fetched, batch_size = self.execute_task()
+            except Exception as e:
+                print(f"Error in unified order poller: {e}")
+            time.sleep(self.poll_interval.next(fetched, batch_size))
+
+    def execute_task(self):
+        """
+        认领并分发一轮订单
+        :return: (认领到的订单数, 本轮最多认领数)；所有阶段都没有处理能力时订单数为 None
+        """
+        with session_scope() as db:
+            dao = SelfStockOrderDAO(db)
+            for service in self.services:
+                service.prepare(dao)
+            stages = [(service, service.claim_stage()) for service in self.services]
+            stages = [(service, stage) for service, stage in stages if stage is not None and stage.limit > 0]
+            if not stages:
+                return None, 1
+            results = dao.claim_orders_for_stages([stage for _, stage in stages], self.lease_seconds)
+        for (service, _), orders in zip(stages, results):
+            if orders:
+                service.dispatch(orders)
+        return sum(len(orders) for orders in results), sum(stage.limit for _, stage in stages)
@@ -1,62 +1,153 @@
 import threading
 import time
-from app.Order.order_dao import SelfStockOrderDAO
-from sqlalchemy.orm import Session
-from app.Order.order_dao import SessionLocal
-from app.service.order_service import OrderService
+from app.Order.migrations import run_migrations
+from app.Order.order_dao import ClaimStage, SelfStockOrderDAO, claim_owner
+from app.Order.order_dao import session_scope
+from app.service.adaptive_interval import AdaptiveInterval
+from app.service.order_deadline import (EXPIRE_FROM_SMS_CODE, ORDER_EXPIRED_MESSAGE, SMS_CODE_TTL, expire_before,
+                                        is_expired)
+from app.service.order_events import SMS_CODE_RECEIVED, order_events
+from app.service.order_service import OrderService, order_worker_pool, status_writer
+from app.service.retry_policy import RetryPolicy
 from app.rpa.request import PlaceOrderRequest
 
 
 class OrderPushService:
-    def __init__(self, interval=10, order_status="201", supplier_code="hubei-dianxin"):
+    def __init__(self, interval=10, order_status="201", supplier_code="hubei-dianxin", min_interval=0.5,
+                 max_interval=60, batch_size=10, order_ttl=SMS_CODE_TTL):
         self.interval = interval
+        # 轮询间隔随查询结果自适应：空闲时逐步放大，满批时连续拉取
+        self.poll_interval = AdaptiveInterval(interval, min_interval, max_interval)
+        # 每轮最多认领的订单数
+        self.batch_size = batch_size
         self.is_running = False
         self.thread = None
         self.default_order_status = order_status
         self.default_supplier_code = supplier_code
+        # 订单认领者标识和租约时长，多个进程共享订单表时避免重复处理
+        self.claim_owner = claim_owner(f"OrderPushService-{supplier_code}")
+        self.lease_seconds = 600
+        # 订单并行处理线程池（各服务共享，按供应商限制并发）
+        self.worker_pool = order_worker_pool
+        # 订单状态批量回写（各服务共享）
+        self.status_writer = status_writer
+        # 验证码到达后超过 order_ttl 秒未提交即超时（验证码已失效），置为 expired_status；
+        # 0 表示不超时（默认，见 RPA_SMS_CODE_TTL）。没有记录到达时间的订单不超时
+        self.order_ttl = order_ttl
+        self.expire_from = EXPIRE_FROM_SMS_CODE
+        self.expired_status = 5
+        self.expire_interval = 60
+        self._last_expire = 0
+        # 处理异常的订单按指数退避重试，多次失败后置为失败状态
+        self.retry_policy = RetryPolicy(failed_status=5)
 
-    def start(self):
-        """Start the order push service."""
+    def start(self, poll=True):
+        """Start the order push service. With poll=False orders are fed by UnifiedOrderPoller instead."""
         if not self.is_running:
+            if poll:
+                try:
+                    run_migrations()
+                except Exception as e:
+                    print(f"Failed to run database migrations: {e}")
             self.is_running = True
-            self.thread = threading.Thread(target=self._run)
-            self.thread.daemon = True
-            self.thread.start()
+            # 验证码到达时由接口直接通知，立即提交下单
+            order_events.subscribe(SMS_CODE_RECEIVED, self.on_sms_code)
+            if poll:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
 
     def stop(self):
         """Stop the order push service."""
         self.is_running = False
+        order_events.unsubscribe(SMS_CODE_RECEIVED, self.on_sms_code)
+        try:
+            self.status_writer.flush()
+        except Exception as e:
+            print(f"Failed to flush order statuses: {e}")
 
     def _run(self):
         """The actual task to be executed periodically."""
         while self.is_running:
+            fetched, limit = None, self.batch_size
             try:
-                self.execute_task()
+                fetched, limit = self.execute_task()
             except Exception as e:
                 print(f"Error in order push task: {e}")
-            time.sleep(self.interval)
+            time.sleep(self.poll_interval.next(fetched, limit))
 
     def execute_task(self):
-        """Fetch and push orders."""
+        """Fetch and push orders. Returns (orders fetched or None if skipped, claim limit of this round)."""
         print("Executing order push task...")
-        db = SessionLocal()
-        try:
+        stage = self.claim_stage()
+        if stage is None:
+            print(f"No free workers for {self.default_supplier_code}, skip this round.")
+            return None, self.batch_size
+        with session_scope() as db:
             dao = SelfStockOrderDAO(db)
-            orders = dao.get_orders_by_status_and_supplier(
-                self.default_order_status, self.default_supplier_code
-            )
-            print(f"Pushing {len(orders)} orders for {self.default_supplier_code}.")
+            self.prepare(dao)
+            orders = dao.claim_orders_for_stages([stage], self.lease_seconds)[0]
+        self.dispatch(orders)
+        return len(orders), stage.limit
+
+    def claim_stage(self):
+        """Claim conditions for this round; None when every worker slot is busy."""
+        # 只认领有空闲线程处理的订单，上一批没处理完时不再拉取
+        slots = self.worker_pool.free_slots(self.default_supplier_code)
+        if slots <= 0:
+            return None
+        return ClaimStage(self.default_order_status, self.default_supplier_code, self.claim_owner,
+                          min(slots, self.batch_size), expire_before(self.order_ttl), self.expire_from)
 
-            # 遍历订单并推送
-            for order in orders:
-                self.push_order(order)
+    def prepare(self, dao):
+        """Housekeeping before claiming."""
+        self.expire_stale_orders(dao)
 
-        finally:
-            db.close()
+    def dispatch(self, orders):
+        """Push claimed orders in parallel."""
+        print(f"Pushing {len(orders)} orders for {self.default_supplier_code}.")
+        for order in orders:
+            if self.worker_pool.try_submit(self.default_supplier_code, self.push_order, order) is None:
+                # 其他服务占用了空位，释放认领等待下次查询
+                self.release_claim(order)
 
-    @staticmethod
-    def push_order(order):
+    def on_sms_code(self, order):
+        """
+        验证码到达后立即认领并提交该订单
+        :return: 是否已提交；不属于本服务、已被认领或没有空闲线程时返回 False，由轮询处理
+        """
+        if (not self.is_running or order.supplier_code != self.default_supplier_code
+                or str(order.order_status) != str(self.default_order_status)):
+            return False
+        with session_scope() as db:
+            # 轮询可能已用同一认领者认领并提交了该订单，只认领空闲的订单，避免同一标签页重复提交
+            orders = SelfStockOrderDAO(db).claim_orders_by_ids(
+                [order.order_id], self.default_order_status, self.claim_owner, self.lease_seconds, renew_own=False)
+        if not orders:
+            return False
+        if self.worker_pool.try_submit(self.default_supplier_code, self.push_order, orders[0]) is None:
+            self.release_claim(orders[0])
+            return False
+        print(f"Order {order.order_no} received SMS code, pushing now.")
+        return True
+
+    def expire_stale_orders(self, dao):
+        """Mark unclaimed orders whose SMS code is older than order_ttl as expired, at most once per expire_interval."""
+        if not self.order_ttl or time.time() - self._last_expire < self.expire_interval:
+            return
+        self._last_expire = time.time()
+        count = dao.expire_orders(self.default_order_status, self.default_supplier_code,
+                                  expire_before(self.order_ttl), self.expired_status, ORDER_EXPIRED_MESSAGE,
+                                  self.expire_from)
+        if count:
+            print(f"Expired {count} orders for {self.default_supplier_code}.")
+
+    def push_order(self, order):
         """Push a single order using OrderService."""
+        if is_expired(order, self.order_ttl, since=self.expire_from):
+            print(f"Order {order.order_no} expired, skip pushing.")
+            self.status_writer.write(order.order_id, self.expired_status, ORDER_EXPIRED_MESSAGE, self.claim_owner)
+            return
         request = PlaceOrderRequest(
             open_url=order.distributor_url,
             order_id=order.order_no,
@@ -71,9 +162,18 @@ class OrderPushService:
             response = OrderService.execute_place_order(request)
             #https://xyy.jxschot.com/mobile-template/index.html?xyyOrderNo=XYY20250528132119001?p=D8043BE088B8A92B1BDFF97496EA1F006071AA22F4C599997986F3054A626DAA
             print(f"###### 推送订单获取订单凭证: {response}")
-            db = SessionLocal()
-            dao = SelfStockOrderDAO(db)
-            # 验证码发送成功后更新订单状态为 102
-            dao.update_order_status_by_id(order.order_id, 202 if response.get("code") == 200 else 5,  response.get("responseData") if  response.get("code") != 200 else response.get("data"))
+            if 'error' in response:
+                # 流程异常（页面元素缺失、超时等），退避后重试
+                self.status_writer.fail(order.order_id, order.order_status, response['error'], self.retry_policy,
+                                        self.claim_owner)
+                return
+            # 验证码发送成功后更新订单状态为 102（批量回写，写回后释放认领）
+            self.status_writer.write(order.order_id, 202 if response.get("code") == 200 else 5,  response.get("responseData") if  response.get("code") != 200 else response.get("data"),
+                                     self.claim_owner)
         except Exception as e:
-            print(f"Failed to send SMS for order {order.order_no}: {e}")
\ No newline at end of file
+            print(f"Failed to send SMS for order {order.order_no}: {e}")
+            self.status_writer.fail(order.order_id, order.order_status, e, self.retry_policy, self.claim_owner)
+
+    def release_claim(self, order):
+        """释放订单认领（随下一批状态回写提交）"""
+        self.status_writer.release(order.order_id, self.claim_owner)
\ No newline at end of file
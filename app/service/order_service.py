@@ -1,18 +1,89 @@
+import os
+
 from app.rpa.request import PlaceOrderRequest
 from app.rpa.strategies.self_page_strategy import SelfPageStrategy
 from app.rpa.strategies.hubei_page_strategy import HuBeiPageStrategy
-from app.rpa.base import RPABaseService
+from app.rpa.base import RPABaseService, BrowserSupplierStrategy
+from app.rpa.browser_supervisor import BrowserSupervisor
 from fastapi import HTTPException
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from app.rpa.strategies.weidian_page_strategy import WeiDianPageStrategy
+from app.service.job_service import JobStore
+from app.service.order_worker_pool import OrderWorkerPool
+from app.service.rpa_executor import RPAExecutor
+from app.service.session_registry import SessionRegistry
+from app.service.status_writer import StatusWriter
+
+# 启用接口直连的供应商，逗号分隔，如 RPA_REPLAY_SUPPLIERS=weidian；只有提交订单也能直连的供应商才会生效
+REPLAY_SUPPLIERS = {code.strip() for code in os.environ.get('RPA_REPLAY_SUPPLIERS', '').split(',') if code.strip()}
 
 SUPPLIER_STRATEGIES = {
     "self": SelfPageStrategy(),  # 添加自营的策略
     "hubei-dianxin": HuBeiPageStrategy(),
-    "weidian": WeiDianPageStrategy()
+    "weidian": WeiDianPageStrategy(replay="weidian" in REPLAY_SUPPLIERS)
 }
 
+
+def browser_capacity() -> int:
+    """所有供应商浏览器池可同时承载的订单数"""
+    return sum(strategy.pool.capacity for strategy in SUPPLIER_STRATEGIES.values()
+               if isinstance(strategy, BrowserSupplierStrategy))
+
+
+# 浏览器健康检查：崩溃自动重启，定期回收
+browser_supervisor = BrowserSupervisor([strategy.pool for strategy in SUPPLIER_STRATEGIES.values()
+                                        if isinstance(strategy, BrowserSupplierStrategy)])
+browser_supervisor.start()
+
+
+def close_browsers():
+    """进程退出前关闭所有浏览器池中的浏览器，避免留下 Chromium 进程占用调试端口"""
+    browser_supervisor.stop()
+    for strategy in SUPPLIER_STRATEGIES.values():
+        if isinstance(strategy, BrowserSupplierStrategy):
+            try:
+                strategy.pool.close()
+            except Exception as e:
+                print(f"###### 关闭浏览器池 {strategy.pool.name} 异常: {e}")
+
+
+# RPA 流程统一在该线程池中执行，线程数与浏览器容量一致
+rpa_executor = RPAExecutor(max_workers=browser_capacity())
+# 异步任务模式下的任务仓库
+job_store = JobStore(rpa_executor)
+# 后台服务的订单处理线程池，每个供应商的并发数不超过其浏览器池容量
+order_worker_pool = OrderWorkerPool(
+    max_workers=browser_capacity(),
+    supplier_limits={code: strategy.pool.capacity for code, strategy in SUPPLIER_STRATEGIES.items()
+                     if isinstance(strategy, BrowserSupplierStrategy)})
+# 订单会话所在进程登记，多进程部署时下单请求转发到持有标签页的进程
+session_registry = SessionRegistry()
+for strategy in SUPPLIER_STRATEGIES.values():
+    if isinstance(strategy, BrowserSupplierStrategy):
+        strategy.session_listeners.append(session_registry.on_session)
+# 后台服务的订单状态批量回写
+status_writer = StatusWriter()
+status_writer.start()
+
+def resource_policy_stats() -> Dict[str, Any]:
+    """各供应商页面资源拦截统计，用于评估拦截带来的页面加载延迟"""
+    return {code: strategy.resource_policy.stats() for code, strategy in SUPPLIER_STRATEGIES.items()
+            if isinstance(strategy, BrowserSupplierStrategy) and strategy.resource_policy is not None}
+
+
+def free_sessions(supplier_code: str) -> Optional[int]:
+    """
+    该供应商还能打开的订单会话数；订单标签页从获取验证码一直保留到提交订单，
+    会话满了再打开新标签页会淘汰仍在等待验证码的订单
+    :return: 非浏览器策略返回 None
+    """
+    strategy = SUPPLIER_STRATEGIES.get(supplier_code.lower())
+    if not isinstance(strategy, BrowserSupplierStrategy):
+        return None
+    return max(0, strategy.sessions.max_sessions - len(strategy.sessions))
+
+
 def get_supplier_strategy(supplier_code: str, order_id: Optional[str] = None) -> RPABaseService:
     """获取对应的供应商策略实例，优先复用已有会话"""
     strategy = SUPPLIER_STRATEGIES.get(supplier_code.lower())
@@ -21,6 +92,14 @@ def get_supplier_strategy(supplier_code: str, order_id: Optional[str] = None) ->
     rpa_service = RPABaseService(strategy)
     return rpa_service
 
+
+def find_session_worker(request: PlaceOrderRequest) -> Optional[str]:
+    """订单会话所在的其他进程地址；会话在本进程或没有登记时返回 None"""
+    strategy = SUPPLIER_STRATEGIES.get(request.supplier_code.lower())
+    if isinstance(strategy, BrowserSupplierStrategy) and strategy.get_order_tab(request.order_id) is not None:
+        return None
+    return session_registry.owner(request.order_id)
+
 class OrderService:
     @staticmethod
     def get_verification_code(request: PlaceOrderRequest):
@@ -33,7 +112,23 @@ class OrderService:
 
     @staticmethod
     def execute_place_order(request: PlaceOrderRequest):
-        """下单接口"""
+        """下单接口，订单会话在其他进程时转发到该进程执行"""
+        worker_url = find_session_worker(request)
+        if worker_url is None:
+            return OrderService.execute_local_place_order(request)
+        print(f"###### 订单 {request.order_id} 的会话在 {worker_url}，转发下单请求")
+        try:
+            return session_registry.forward_place_order(worker_url, request)
+        except Exception as e:
+            return {
+                'code': 500,
+                'error': f"转发下单请求到 {worker_url} 失败: {e}",
+                'supplier_response': ""
+            }
+
+    @staticmethod
+    def execute_local_place_order(request: PlaceOrderRequest):
+        """在本进程下单"""
         rpa_service = get_supplier_strategy(request.supplier_code, request.order_id)
         result = rpa_service.execute_place_order(request)
         return result
\ No newline at end of file
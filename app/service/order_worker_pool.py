@@ -0,0 +1,77 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class OrderWorkerPool:
+    """
+    后台服务的订单处理线程池
+    总并发数为 max_workers，每个供应商的并发数另受 supplier_limits 限制；
+    后台服务按 free_slots() 决定本轮认领多少订单，没有空位时不再拉取新订单
+    """
+
+    def __init__(self, max_workers=4, supplier_limits=None, default_limit=None):
+        """
+        :param max_workers: 总线程数
+        :param supplier_limits: {supplier_code: 并发上限}
+        :param default_limit: 未配置的供应商的并发上限，默认与总线程数一致
+        """
+        self.max_workers = max(1, max_workers)
+        self.supplier_limits = dict(supplier_limits or {})
+        self.default_limit = default_limit or self.max_workers
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="order-worker")
+        self._lock = threading.Lock()
+        self._running = 0
+        self._running_by_supplier = {}
+
+    def limit(self, supplier_code):
+        return max(1, self.supplier_limits.get(supplier_code, self.default_limit))
+
+    def free_slots(self, supplier_code):
+        """该供应商当前还能提交的订单数"""
+        with self._lock:
+            return self._free_slots(supplier_code)
+
+    def running(self, supplier_code):
+        """该供应商正在处理的订单数"""
+        with self._lock:
+            return self._running_by_supplier.get(supplier_code, 0)
+
+    def _free_slots(self, supplier_code):
+        total_free = self.max_workers - self._running
+        supplier_free = self.limit(supplier_code) - self._running_by_supplier.get(supplier_code, 0)
+        return max(0, min(total_free, supplier_free))
+
+    def try_submit(self, supplier_code, fn, *args, **kwargs):
+        """
+        有空位时提交订单处理任务
+        :return: concurrent.futures.Future，没有空位时返回 None
+        """
+        with self._lock:
+            if self._free_slots(supplier_code) <= 0:
+                return None
+            self._running += 1
+            self._running_by_supplier[supplier_code] = self._running_by_supplier.get(supplier_code, 0) + 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._done(supplier_code)
+            raise
+        future.add_done_callback(lambda _: self._done(supplier_code))
+        return future
+
+    def _done(self, supplier_code):
+        with self._lock:
+            self._running -= 1
+            self._running_by_supplier[supplier_code] -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'running': self._running,
+                'suppliers': {code: {'running': running, 'limit': self.limit(code)}
+                              for code, running in self._running_by_supplier.items()},
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
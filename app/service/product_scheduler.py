@@ -0,0 +1,141 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class ProductRateScheduler:
+    """
+    按商品限流的订单调度器
+    每个商品一个按 priority(item) 排序的队列（默认先进先出）；有订单的商品按下次可处理时间放入小顶堆，
+    take() 只看堆顶，睡眠到最早的商品可处理为止，不需要每秒遍历全部商品
+    """
+
+    def __init__(self, default_interval=60, product_intervals=None, priority=None):
+        """
+        :param default_interval: 同一商品两次处理的默认间隔（秒）
+        :param product_intervals: {product_code: 间隔秒数}，单独配置的商品间隔
+        :param priority: 商品内订单的排序键函数，值越小越先处理，如订单截止时间
+        """
+        self.default_interval = default_interval
+        self.product_intervals = dict(product_intervals or {})
+        self.priority = priority
+        self._queues = {}     # {product_code: [(priority, seq, item)]}
+        self._next_at = {}
+        self._heap = []       # [(next_at, token, product_code)]
+        self._scheduled = {}  # {product_code: token}，堆中 token 不一致的项已失效
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._generation = 0
+
+    def interval(self, product_code):
+        return self.product_intervals.get(product_code, self.default_interval)
+
+    def set_interval(self, product_code, seconds):
+        """调整商品的处理间隔，从该商品下一次处理开始生效"""
+        with self._cond:
+            self.product_intervals[product_code] = seconds
+
+    def next_at(self, product_code):
+        """商品下次可处理的时间戳"""
+        with self._cond:
+            return self._next_at.get(product_code, 0)
+
+    def restore(self, next_at):
+        """恢复各商品的下次可处理时间（如服务重启前保存的状态），已过去的时间忽略"""
+        now = time.time()
+        with self._cond:
+            for product_code, at in next_at.items():
+                if at > now:
+                    self._next_at[product_code] = at
+            for product_code in list(self._scheduled):
+                self._schedule(product_code)
+            self._cond.notify_all()
+
+    def _schedule(self, product_code):
+        token = next(self._seq)
+        self._scheduled[product_code] = token
+        heapq.heappush(self._heap, (self._next_at.get(product_code, 0), token, product_code))
+
+    def add(self, product_code, item):
+        """订单加入商品队列"""
+        key = self.priority(item) if self.priority else 0
+        with self._cond:
+            queue = self._queues.setdefault(product_code, [])
+            heapq.heappush(queue, (key, next(self._seq), item))
+            if product_code not in self._scheduled:
+                self._schedule(product_code)
+                self._cond.notify()
+
+    def take(self, timeout=None):
+        """
+        取出最早可处理的商品中优先级最高的订单，并把该商品的下次可处理时间推后一个间隔
+        :return: (product_code, item)；超时或被 interrupt() 唤醒时返回 None
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            generation = self._generation
+            while generation == self._generation:
+                now = time.time()
+                wait = None if deadline is None else deadline - now
+                while self._heap and self._scheduled.get(self._heap[0][2]) != self._heap[0][1]:
+                    heapq.heappop(self._heap)
+                if self._heap:
+                    next_at, _, product_code = self._heap[0]
+                    if next_at <= now:
+                        return self._pop(product_code, now)
+                    wait = next_at - now if wait is None else min(wait, next_at - now)
+                if wait is not None and wait <= 0:
+                    return None
+                self._cond.wait(wait)
+            return None
+
+    def _pop(self, product_code, now):
+        heapq.heappop(self._heap)
+        queue = self._queues[product_code]
+        _, _, item = heapq.heappop(queue)
+        self._next_at[product_code] = now + self.interval(product_code)
+        if queue:
+            self._schedule(product_code)
+        else:
+            del self._queues[product_code]
+            del self._scheduled[product_code]
+        return product_code, item
+
+    def remove_where(self, predicate):
+        """移出所有满足条件的订单（如已超时的订单），不影响商品的限流时间"""
+        removed = []
+        with self._cond:
+            for product_code in list(self._queues):
+                queue = self._queues[product_code]
+                kept = [entry for entry in queue if not predicate(entry[2])]
+                if len(kept) == len(queue):
+                    continue
+                removed += [entry[2] for entry in queue if predicate(entry[2])]
+                if kept:
+                    heapq.heapify(kept)
+                    self._queues[product_code] = kept
+                else:
+                    del self._queues[product_code]
+                    del self._scheduled[product_code]
+        return removed
+
+    def interrupt(self):
+        """唤醒所有阻塞在 take() 的线程"""
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+
+    def items(self):
+        """队列中所有订单"""
+        with self._cond:
+            return [entry[2] for queue in self._queues.values() for entry in queue]
+
+    def sizes(self):
+        """{product_code: 排队订单数}"""
+        with self._cond:
+            return {product_code: len(queue) for product_code, queue in self._queues.items()}
+
+    def __len__(self):
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
@@ -0,0 +1,15 @@
+class RetryPolicy:
+    """
+    订单处理失败后的重试策略
+    第 n 次失败后等待 base_delay * 2^(n-1) 秒（不超过 max_delay）再重试，失败 max_attempts 次后置为 failed_status
+    """
+
+    def __init__(self, failed_status, max_attempts=5, base_delay=30, max_delay=1800):
+        self.failed_status = failed_status
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempts):
+        """第 attempts 次失败后的退避秒数"""
+        return min(self.base_delay * 2 ** max(attempts - 1, 0), self.max_delay)
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutorSaturatedError(Exception):
+    """RPA 执行器已满（执行中 + 排队的任务达到上限）"""
+    pass
+
+
+class RPAExecutor:
+    """
+    RPA 专用线程池
+    DrissionPage 的流程全部是阻塞调用，放到独立线程池中执行，避免阻塞 FastAPI 事件循环；
+    执行线程数与浏览器池容量一致，排队数超过 max_queue 时直接拒绝
+    """
+
+    def __init__(self, max_workers, max_queue=None):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = self.max_workers if max_queue is None else max_queue
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rpa")
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        提交任务
+        :return: concurrent.futures.Future
+        :raises ExecutorSaturatedError: 执行器已满
+        """
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorSaturatedError(
+                f"RPA executor saturated: {self.max_workers} running, {self.max_queue} queued")
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    async def run(self, fn, *args, **kwargs):
+        """在事件循环中等待任务完成"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self):
+        with self._lock:
+            pending = self._pending
+        return {
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'pending': pending,
+            'running': min(pending, self.max_workers),
+            'queued': max(0, pending - self.max_workers),
+        }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
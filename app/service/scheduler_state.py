@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+def app_data_dir():
+    """当前用户的应用数据目录：Windows 为 LOCALAPPDATA，其他系统为 XDG_DATA_HOME 或 ~/.local/share"""
+    if os.name == 'nt':
+        return os.environ.get('LOCALAPPDATA') or os.path.expanduser(os.path.join('~', 'AppData', 'Local'))
+    return os.environ.get('XDG_DATA_HOME') or os.path.expanduser(os.path.join('~', '.local', 'share'))
+
+
+# 状态文件目录，可通过 RPA_STATE_DIR 指定；默认在用户的应用数据目录下，重启机器后仍保留，不写入代码目录
+STATE_DIR = os.environ.get('RPA_STATE_DIR') or os.path.join(app_data_dir(), 'rpa_state')
+
+
+def default_state_path(name):
+    """STATE_DIR 下名为 name 的状态文件路径，目录不存在时创建"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = os.path.join(STATE_DIR, name)
+    print(f"#### 调度状态文件: {path}")
+    return path
+
+
+class SchedulerStateStore:
+    """
+    限流调度状态的本地持久化（SQLite）
+    保存各商品的下次可处理时间、排队中的订单以及认领者标识，服务重启后据此恢复，
+    既不会让所有商品重新等待一个完整间隔，也不会立即对同一商品重复下单
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS product_next_at "
+                               "(product_code TEXT PRIMARY KEY, next_at REAL NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS queued_order "
+                               "(order_id INTEGER PRIMARY KEY, product_code TEXT, order_no TEXT, queued_at REAL)")
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).fetchall()
+
+    def get_owner(self):
+        rows = self._execute("SELECT value FROM meta WHERE key = 'owner'")
+        return rows[0][0] if rows else None
+
+    def set_owner(self, owner):
+        self._execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('owner', ?)", (owner,))
+
+    def load_next_at(self):
+        """{product_code: 下次可处理时间戳}，顺带清理已过期的记录"""
+        self._execute("DELETE FROM product_next_at WHERE next_at <= ?", (time.time(),))
+        return dict(self._execute("SELECT product_code, next_at FROM product_next_at"))
+
+    def save_next_at(self, product_code, next_at):
+        self._execute("INSERT OR REPLACE INTO product_next_at (product_code, next_at) VALUES (?, ?)",
+                      (product_code, next_at))
+
+    def load_queued_ids(self):
+        """排队中的订单ID，按入队顺序"""
+        return [row[0] for row in self._execute("SELECT order_id FROM queued_order ORDER BY queued_at")]
+
+    def add_order(self, order):
+        self._execute("INSERT OR REPLACE INTO queued_order (order_id, product_code, order_no, queued_at) "
+                      "VALUES (?, ?, ?, ?)", (order.order_id, order.goods_code, order.order_no, time.time()))
+
+    def remove_orders(self, order_ids):
+        if order_ids:
+            self._execute(f"DELETE FROM queued_order WHERE order_id IN ({','.join('?' * len(order_ids))})",
+                          tuple(order_ids))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,72 @@
+import os
+
+import requests
+
+from app.Order.order_dao import SelfStockOrderDAO, session_scope
+from app.rpa.session_store import DEFAULT_SESSION_TTL, SESSION_CLOSED, SESSION_OPENED
+
+# 本进程 API 的访问地址，由进程管理器为运行 API 的进程设置；为空时本进程的会话不登记，其他进程无法转发到本进程
+WORKER_URL = os.environ.get('RPA_WORKER_URL', '')
+# 转发下单请求的超时（秒），需覆盖对方进程排队和提交订单的耗时
+FORWARD_TIMEOUT = 60
+# 接收转发的下单接口，只在本进程执行
+LOCAL_PLACE_ORDER_PATH = '/api/v1/internal/place-order'
+
+
+class SessionRegistry:
+    """
+    订单会话注册表
+    订单标签页只存在于打开它的进程中：打开/关闭标签页时在数据库登记会话所在进程的地址，
+    其他进程收到该订单的下单请求（接口或推送服务）时转发到该进程执行
+    """
+
+    def __init__(self, worker_url=WORKER_URL, ttl=DEFAULT_SESSION_TTL, timeout=FORWARD_TIMEOUT):
+        """
+        :param worker_url: 本进程 API 的访问地址，如 http://10.0.0.5:5001
+        :param ttl: 登记的有效期（秒），与订单会话保留时间一致，进程崩溃未删除的登记到期后失效
+        """
+        self.worker_url = worker_url.rstrip('/')
+        self.ttl = ttl
+        self.timeout = timeout
+        self.http = requests.Session()
+
+    @property
+    def enabled(self):
+        return bool(self.worker_url)
+
+    def on_session(self, event, supplier_code, order_no):
+        """BrowserSupplierStrategy 的会话回调：打开时登记，关闭时删除本进程的登记"""
+        if not self.enabled or not order_no:
+            return
+        try:
+            with session_scope() as db:
+                dao = SelfStockOrderDAO(db)
+                if event == SESSION_OPENED:
+                    dao.register_session(order_no, supplier_code, self.worker_url, self.ttl)
+                elif event == SESSION_CLOSED:
+                    dao.remove_session(order_no, self.worker_url)
+        except Exception as e:
+            print(f"###### 订单会话登记失败: {order_no}: {e}")
+
+    def owner(self, order_no):
+        """
+        订单会话所在的其他进程地址
+        :return: 会话在本进程、没有登记或已过期时返回 None
+        """
+        # 不运行 API 的进程不登记会话，但仍可把下单请求转发给登记了会话的进程
+        if not order_no:
+            return None
+        try:
+            with session_scope() as db:
+                worker_url = SelfStockOrderDAO(db).get_session_worker(order_no)
+        except Exception as e:
+            print(f"###### 查询订单会话失败: {order_no}: {e}")
+            return None
+        return worker_url if worker_url and worker_url != self.worker_url else None
+
+    def forward_place_order(self, worker_url, request):
+        """把下单请求转发到会话所在进程执行，返回对方的下单结果"""
+        response = self.http.post(worker_url + LOCAL_PLACE_ORDER_PATH, data=request.json(),
+                                  headers={'Content-Type': 'application/json'}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
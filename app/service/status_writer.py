@@ -0,0 +1,168 @@
+import threading
+
+from sqlalchemy import text
+
+from app.Order.order_dao import SelfStockOrderDAO, session_scope
+
+
+class StatusWriter:
+    """
+    订单状态批量回写
+    各服务处理完订单后只把状态放入缓冲区，由后台线程每 flush_interval 秒或缓冲满 max_batch 条时
+    批量写回；处理失败的订单累计失败次数并记录下次重试时间。
+    订单认领在状态和失败记录写回之后才释放，保证释放认领时结果已经落库，不会被立即重复认领。
+    批量写回失败时改为逐条写回，个别写不进去的订单不影响其他订单；数据库可用但仍写入失败 max_retries 次的订单被丢弃，
+    其认领等租约过期后释放
+    """
+
+    def __init__(self, flush_interval=1.0, max_batch=100, max_retries=5):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self._retries = {}   # {order_id: 数据库可用时逐条写回失败的次数}
+        self._updates = {}   # {order_id: (new_status, order_message)}
+        self._releases = {}  # {order_id: owner}
+        self._failures = {}  # {order_id: (order_status, error, retry_policy)}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self.is_running = False
+        self.thread = None
+
+    def start(self):
+        if not self.is_running:
+            self.is_running = True
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.is_running = False
+        self._wakeup.set()
+        self.flush()
+
+    def write(self, order_id, new_status, order_message, owner=None):
+        """登记订单状态，owner 不为空时状态写回后释放该认领者对订单的认领"""
+        with self._lock:
+            self._updates[order_id] = (new_status, order_message)
+            if owner:
+                self._releases[order_id] = owner
+            full = len(self._updates) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def fail(self, order_id, order_status, error, retry_policy, owner=None):
+        """登记订单处理失败，写回时累计失败次数并按 retry_policy 退避；owner 不为空时随后释放认领"""
+        with self._lock:
+            self._failures[order_id] = (order_status, error, retry_policy)
+            if owner:
+                self._releases[order_id] = owner
+
+    def release(self, order_id, owner):
+        """只释放认领，不修改订单状态"""
+        with self._lock:
+            self._releases[order_id] = owner
+
+    def _run(self):
+        while self.is_running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"###### 订单状态批量回写异常: {e}")
+
+    def flush(self):
+        """写回缓冲区中的全部状态；批量写回失败时逐条写回，写不进去的订单放回缓冲区等待下次重试"""
+        with self._flush_lock:
+            with self._lock:
+                updates, self._updates = self._updates, {}
+                failures, self._failures = self._failures, {}
+                releases, self._releases = self._releases, {}
+            if not updates and not failures and not releases:
+                return
+            order_ids = set(updates) | set(failures) | set(releases)
+            try:
+                self._write_batch(updates, failures, releases)
+            except Exception as e:
+                print(f"###### 订单状态批量回写失败，改为逐条写回: {e}")
+                self._write_each(updates, failures, releases)
+                return
+            with self._lock:
+                for order_id in order_ids:
+                    self._retries.pop(order_id, None)
+
+    @staticmethod
+    def _write_batch(updates, failures, releases):
+        """批量写回；已写回的失败记录从 failures 中移除，避免逐条写回时重复累计失败次数"""
+        with session_scope() as db:
+            dao = SelfStockOrderDAO(db)
+            if updates:
+                dao.update_order_statuses(
+                    [(order_id, status, message) for order_id, (status, message) in updates.items()])
+                updates.clear()
+            by_stage = {}
+            for order_id, (order_status, error, policy) in failures.items():
+                by_stage.setdefault((order_status, policy), []).append((order_id, error))
+            for (order_status, policy), stage_failures in by_stage.items():
+                exhausted = dao.record_failures(order_status, stage_failures, policy.delay,
+                                                policy.max_attempts, policy.failed_status)
+                for order_id, _ in stage_failures:
+                    failures.pop(order_id)
+                if exhausted:
+                    print(f"###### 订单多次处理失败，不再重试: {exhausted}")
+            by_owner = {}
+            for order_id, owner in releases.items():
+                by_owner.setdefault(owner, []).append(order_id)
+            for owner, order_ids in by_owner.items():
+                dao.release_claims(order_ids, owner)
+
+    def _write_each(self, updates, failures, releases):
+        """逐条写回，每条一个事务；状态没写进去的订单暂不释放认领"""
+        failed = set()
+
+        def write(order_id, fn):
+            try:
+                with session_scope() as db:
+                    fn(SelfStockOrderDAO(db))
+            except Exception as e:
+                print(f"###### 订单 {order_id} 状态回写失败: {e}")
+                failed.add(order_id)
+
+        for order_id, (status, message) in updates.items():
+            write(order_id, lambda dao: dao.update_order_statuses([(order_id, status, message)]))
+        for order_id, (order_status, error, policy) in failures.items():
+            write(order_id, lambda dao: dao.record_failures(order_status, [(order_id, error)], policy.delay,
+                                                            policy.max_attempts, policy.failed_status))
+        for order_id, owner in releases.items():
+            if order_id not in failed:
+                write(order_id, lambda dao: dao.release_claims([order_id], owner))
+
+        # 数据库不可用时所有订单都会失败，只放回缓冲区，不计入失败次数
+        count = bool(failed) and self._database_available()
+        with self._lock:
+            for order_id in set(updates) | set(failures) | set(releases):
+                if order_id not in failed:
+                    self._retries.pop(order_id, None)
+                    continue
+                if count:
+                    self._retries[order_id] = self._retries.get(order_id, 0) + 1
+                    if self._retries[order_id] >= self.max_retries:
+                        del self._retries[order_id]
+                        print(f"###### 订单 {order_id} 状态回写失败 {self.max_retries} 次，放弃回写："
+                              f"{updates.get(order_id) or failures.get(order_id)}")
+                        continue
+                if order_id in updates:
+                    self._updates.setdefault(order_id, updates[order_id])
+                if order_id in failures:
+                    self._failures.setdefault(order_id, failures[order_id])
+                if order_id in releases:
+                    self._releases.setdefault(order_id, releases[order_id])
+
+    @staticmethod
+    def _database_available():
+        try:
+            with session_scope() as db:
+                db.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
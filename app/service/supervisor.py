@@ -0,0 +1,232 @@
+"""
+服务进程管理
+把 API 和各后台服务放到独立进程中运行，进程退出后自动重启，收到 SIGINT/SIGTERM 时依次通知子进程退出
+
+    python -m app.service.supervisor --layout scale-out --replicas worker=3
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+# 每个进程的浏览器调试端口从 RPA_BASE_PORT（默认 9222）+ 序号 * PORT_STRIDE 开始分配，避免多个进程抢同一端口
+BASE_PORT = int(os.environ.get('RPA_BASE_PORT', 9222))
+PORT_STRIDE = 100
+
+API_HOST = "0.0.0.0"
+# 运行 API 的进程监听 API_PORT + 序号，并以 http://RPA_WORKER_HOST:端口 登记订单会话，接收其他进程转发的下单请求
+API_PORT = 5000
+WORKER_HOST = os.environ.get('RPA_WORKER_HOST', '127.0.0.1')
+
+# 每个进程组内运行的服务；orders 为统一轮询（一个查询为 background、weidian、push 三个阶段认领订单）。
+# 订单的浏览器会话只存在于创建它的进程中，运行 API 的进程登记会话并接收转发的下单请求；
+# 不运行 API 的进程（split 的 orders、per-service 的后台服务）无法接收转发，因此发送验证码（background）和
+# 提交订单（push）必须放在同一进程组中。
+# scale-out 的 worker 进程各自运行 API 和发送验证码、提交订单的服务，可多副本横向扩展
+LAYOUTS = {
+    'single': {'main': ('api', 'orders')},
+    'split': {'api': ('api',), 'orders': ('orders',)},
+    'per-service': {'api': ('api',), 'hubei': ('background', 'push'), 'weidian': ('weidian',)},
+    'scale-out': {'main': ('api', 'weidian'), 'worker': ('api', 'background', 'push')},
+}
+
+# 不能多副本运行的服务：微店按商品限流的状态在进程内
+SINGLETON_SERVICES = ('weidian', 'orders')
+
+
+def build_service(name):
+    """创建后台服务实例（在子进程中调用）"""
+    if name == 'background':
+        from app.service.background_service import BackgroundService
+        return BackgroundService(interval=5)
+    if name == 'weidian':
+        from app.service.background_service import WeiDianBackgroundService
+        return WeiDianBackgroundService(interval=10, order_status=101, supplier_code="weidian")
+    if name == 'push':
+        from app.service.order_push_service import OrderPushService
+        return OrderPushService(interval=10)
+    if name == 'orders':
+        from app.service.order_poller import UnifiedOrderPoller
+        return UnifiedOrderPoller([build_service('background'), build_service('weidian'), build_service('push')])
+    raise ValueError(f"Unknown service: {name}")
+
+
+def run_group(group, services):
+    """子进程入口：启动进程组内的服务，收到 SIGTERM 后停止"""
+    stop_event = threading.Event()
+    # Ctrl+C 会发给整个进程组，子进程统一等进程管理器发送 SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    started = []
+    try:
+        for name in services:
+            if name != 'api':
+                service = build_service(name)
+                service.start()
+                started.append(service)
+                print(f"[{group}] 服务 {name} 已启动")
+        if 'api' in services:
+            # uvicorn 自行处理 SIGTERM，退出后再停止同进程的后台服务
+            import uvicorn
+            from apiController import app
+            uvicorn.run(app, host=API_HOST, port=int(os.environ.get('RPA_API_PORT', API_PORT)))
+        else:
+            while not stop_event.wait(1):
+                pass
+    finally:
+        for service in started:
+            service.stop()
+        # 关闭本进程的浏览器，重启后的进程才能重新使用这些调试端口
+        from app.service.order_service import close_browsers
+        close_browsers()
+        print(f"[{group}] 进程退出")
+
+
+class _Worker:
+    def __init__(self, group, services, replica, slot):
+        self.group = group
+        self.services = services
+        self.replica = replica
+        self.slot = slot
+        self.process = None
+        self.started_at = 0
+        self.restart_delay = 0
+        self.restart_at = None
+
+    @property
+    def name(self):
+        return f"{self.group}-{self.replica}"
+
+
+class ServiceSupervisor:
+    """
+    服务进程管理器
+    子进程异常退出后按指数退避重启（稳定运行 stable_after 秒后退避时间清零）；
+    停止时先发送 SIGTERM，超过 shutdown_timeout 秒仍未退出的进程强制结束
+    """
+
+    def __init__(self, groups, replicas=None, restart_delay=1, max_restart_delay=60, stable_after=60,
+                 shutdown_timeout=20):
+        """
+        :param groups: {进程组名: (服务名, ...)}，见 LAYOUTS
+        :param replicas: {进程组名: 副本数}
+        """
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stable_after = stable_after
+        self.shutdown_timeout = shutdown_timeout
+        self.is_running = False
+        self._ctx = multiprocessing.get_context('spawn')
+        self.workers = []
+        replicas = replicas or {}
+        for group, services in groups.items():
+            count = max(1, replicas.get(group, 1))
+            if count > 1 and any(name in SINGLETON_SERVICES for name in services):
+                print(f"进程组 {group} 包含单实例服务，忽略副本数 {count}")
+                count = 1
+            for replica in range(count):
+                self.workers.append(_Worker(group, services, replica, len(self.workers)))
+
+    @staticmethod
+    def worker_env(worker):
+        """子进程的环境变量：调试端口范围；运行 API 的进程还有 API 端口和登记会话用的访问地址"""
+        env = {'RPA_BASE_PORT': str(BASE_PORT + worker.slot * PORT_STRIDE), 'RPA_WORKER_URL': ''}
+        if 'api' in worker.services:
+            port = API_PORT + worker.slot
+            env['RPA_API_PORT'] = str(port)
+            env['RPA_WORKER_URL'] = f"http://{WORKER_HOST}:{port}"
+        return env
+
+    def _spawn(self, worker):
+        worker.process = self._ctx.Process(target=run_group, args=(worker.group, worker.services), name=worker.name)
+        # 子进程启动时复制当前环境变量，启动前设置好该进程的端口和地址
+        env = self.worker_env(worker)
+        previous = {name: os.environ.get(name) for name in env}
+        os.environ.update(env)
+        try:
+            worker.process.start()
+        finally:
+            for name, value in previous.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        worker.started_at = time.time()
+        worker.restart_at = None
+        print(f"进程 {worker.name} 已启动，PID {worker.process.pid}，服务: {', '.join(worker.services)}"
+              + (f"，API 端口 {env['RPA_API_PORT']}" if 'RPA_API_PORT' in env else ""))
+
+    def start(self):
+        self.is_running = True
+        for worker in self.workers:
+            self._spawn(worker)
+
+    def check_once(self):
+        """重启已退出的子进程"""
+        now = time.time()
+        for worker in self.workers:
+            if worker.process.is_alive():
+                continue
+            if worker.restart_at is None:
+                if now - worker.started_at >= self.stable_after:
+                    worker.restart_delay = 0
+                worker.restart_delay = min(max(worker.restart_delay * 2, self.restart_delay), self.max_restart_delay)
+                worker.restart_at = now + worker.restart_delay
+                print(f"进程 {worker.name} 已退出，退出码 {worker.process.exitcode}，"
+                      f"{worker.restart_delay} 秒后重启")
+            elif now >= worker.restart_at:
+                self._spawn(worker)
+
+    def run(self):
+        """启动所有进程并持续监控，直到收到 SIGINT/SIGTERM"""
+        stop_event = threading.Event()
+        signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+        signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+        self.start()
+        try:
+            while not stop_event.wait(1):
+                self.check_once()
+        finally:
+            self.stop()
+
+    def stop(self):
+        """通知所有子进程退出，超时后强制结束"""
+        self.is_running = False
+        alive = [w.process for w in self.workers if w.process is not None and w.process.is_alive()]
+        for process in alive:
+            process.terminate()
+        deadline = time.time() + self.shutdown_timeout
+        for process in alive:
+            process.join(max(0, deadline - time.time()))
+            if process.is_alive():
+                print(f"进程 {process.name} 未在 {self.shutdown_timeout} 秒内退出，强制结束")
+                process.kill()
+                process.join()
+        print("所有服务进程已停止")
+
+
+def parse_replicas(values):
+    """解析 group=N 形式的副本数参数"""
+    replicas = {}
+    for value in values or []:
+        group, _, count = value.partition('=')
+        replicas[group] = int(count)
+    return replicas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the API and background services in supervised processes")
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default='single',
+                        help="single: API and order poller in one process; split: API and order poller in "
+                             "separate processes; per-service: one process per supplier; "
+                             "scale-out: replicable workers that route place-order to the session owner")
+    parser.add_argument('--replicas', nargs='*', metavar='GROUP=N', help="replica count per process group")
+    args = parser.parse_args(argv)
+    ServiceSupervisor(LAYOUTS[args.layout], parse_replicas(args.replicas)).run()
+
+
+if __name__ == '__main__':
+    main()
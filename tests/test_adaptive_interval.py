@@ -0,0 +1,24 @@
+from app.service.adaptive_interval import AdaptiveInterval
+
+
+def test_idle_rounds_back_off_up_to_max_interval():
+    interval = AdaptiveInterval(5, min_interval=0.5, max_interval=30)
+
+    assert [interval.next(0, 10) for _ in range(4)] == [10, 20, 30, 30]
+
+
+def test_full_batch_polls_at_min_interval_and_partial_resets():
+    interval = AdaptiveInterval(5, min_interval=0.5, max_interval=30)
+    interval.next(0, 10)
+
+    assert interval.next(10, 10) == 0.5
+    assert interval.next(3, 10) == 5
+    assert interval.next(None, 10) == 5
+
+
+def test_base_interval_is_clamped_to_bounds():
+    assert AdaptiveInterval(100, min_interval=1, max_interval=30).interval == 30
+    assert AdaptiveInterval(0.1, min_interval=1, max_interval=30).interval == 1
+    # max_interval 小于 min_interval 时以 min_interval 为准
+    interval = AdaptiveInterval(5, min_interval=2, max_interval=1)
+    assert interval.next(0, 10) == 2
@@ -0,0 +1,36 @@
+from app.rpa.browser_pool import BrowserPool, free_port
+
+
+def make_pool(tmp_path, **kwargs):
+    return BrowserPool("test", lambda: None, size=1, profile_root=str(tmp_path), **kwargs)
+
+
+def test_restart_keeps_in_flight_leases(tmp_path):
+    pool = make_pool(tmp_path, max_tabs_per_browser=2)
+    browser = pool.browsers[0]
+    try:
+        first = pool.acquire(timeout=0)
+        pool.acquire(timeout=0)
+        pool.restart(first, "test")
+
+        # 重启前租出的两个标签页仍占用名额，归还后才能再租
+        assert browser.active == 2
+        assert pool.in_use == 2
+        pool.release(first)
+        assert browser.active == 1
+        assert pool.acquire(timeout=0) is browser
+    finally:
+        free_port(browser.port)
+
+
+def test_restart_clears_draining_and_served_count(tmp_path):
+    pool = make_pool(tmp_path)
+    browser = pool.browsers[0]
+    try:
+        pool.release(pool.acquire(timeout=0))
+        pool.drain(browser)
+        pool.restart(browser, "test")
+
+        assert (browser.draining, browser.orders_served, browser.active) == (False, 0, 0)
+    finally:
+        free_port(browser.port)
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import union_all
+from sqlalchemy.dialects import mysql
+
+from app.Order.order_dao import (ClaimStage, SelfStockOrder, SelfStockOrderAttempt, SelfStockOrderClaim,
+                                 SelfStockOrderDAO)
+
+
+def add_order(db, order_no, status=101, supplier="hubei-dianxin", minutes_ago=10, **fields):
+    order = SelfStockOrder(order_no=order_no, order_status=status, supplier_code=supplier,
+                           order_time=datetime.now() - timedelta(minutes=minutes_ago), **fields)
+    db.add(order)
+    db.commit()
+    return order.order_id
+
+
+def test_claim_orders_oldest_first_and_skips_claimed(db):
+    older = add_order(db, "A", minutes_ago=20)
+    newer = add_order(db, "B", minutes_ago=5)
+    dao = SelfStockOrderDAO(db)
+
+    first = dao.claim_orders(101, "hubei-dianxin", "owner-1", limit=1)
+    assert [o.order_id for o in first] == [older]
+    second = dao.claim_orders(101, "hubei-dianxin", "owner-2", limit=10)
+    assert [o.order_id for o in second] == [newer]
+    assert dao.claim_orders(101, "hubei-dianxin", "owner-3", limit=10) == []
+
+
+def test_claim_orders_takes_over_expired_lease(db):
+    order_id = add_order(db, "A")
+    db.add(SelfStockOrderClaim(order_id=order_id, owner="crashed", claimed_at=datetime.now() - timedelta(hours=1),
+                               lease_expires_at=datetime.now() - timedelta(minutes=1)))
+    db.commit()
+
+    claimed = SelfStockOrderDAO(db).claim_orders(101, "hubei-dianxin", "owner-1")
+    assert [o.order_id for o in claimed] == [order_id]
+    assert db.get(SelfStockOrderClaim, order_id).owner == "owner-1"
+
+
+def test_claim_orders_skips_backoff_and_expired_orders(db):
+    backing_off = add_order(db, "A")
+    add_order(db, "B", minutes_ago=120)
+    ready = add_order(db, "C")
+    db.add(SelfStockOrderAttempt(order_id=backing_off, order_status=101, attempts=1,
+                                 next_attempt_at=datetime.now() + timedelta(minutes=5), updated_at=datetime.now()))
+    db.commit()
+
+    claimed = SelfStockOrderDAO(db).claim_orders(101, "hubei-dianxin", "owner-1",
+                                                 expire_before=datetime.now() - timedelta(hours=1))
+    assert [o.order_id for o in claimed] == [ready]
+
+
+def test_claim_orders_by_ids_renews_own_claim_by_default(db):
+    order_id = add_order(db, "A", status=201)
+    dao = SelfStockOrderDAO(db)
+    assert dao.claim_orders(201, "hubei-dianxin", "owner-1")
+
+    renewed = dao.claim_orders_by_ids([order_id], 201, "owner-1")
+    assert [o.order_id for o in renewed] == [order_id]
+    assert dao.claim_orders_by_ids([order_id], 201, "owner-2") == []
+
+
+def test_claim_orders_by_ids_without_renewal_skips_own_active_claim(db):
+    """验证码事件与轮询使用同一认领者：轮询已认领的订单不能被事件路径再次认领"""
+    order_id = add_order(db, "A", status=201)
+    dao = SelfStockOrderDAO(db)
+    assert dao.claim_orders(201, "hubei-dianxin", "owner-1")
+
+    assert dao.claim_orders_by_ids([order_id], 201, "owner-1", renew_own=False) == []
+    dao.release_claims([order_id], "owner-1")
+    assert [o.order_id for o in dao.claim_orders_by_ids([order_id], 201, "owner-1", renew_own=False)] == [order_id]
+
+
+def test_claim_stage_branches_have_their_own_limit():
+    now = datetime.now()
+    statement = union_all(SelfStockOrderDAO._claim_select(ClaimStage(101, "weidian", "o", 10, None), now),
+                          SelfStockOrderDAO._claim_select(ClaimStage(201, "hubei-dianxin", "o", 3, None), now))
+    sql = str(statement.compile(dialect=mysql.dialect()))
+    assert sql.count("LIMIT") == 2
+    assert sql.count("FOR UPDATE SKIP LOCKED") == 2
+
+
+def test_record_failures_backs_off_then_fails_order(db):
+    order_id = add_order(db, "A")
+    dao = SelfStockOrderDAO(db)
+
+    assert dao.record_failures(101, [(order_id, "timeout")], lambda n: 30, 2, 4) == []
+    assert dao.claim_orders(101, "hubei-dianxin", "owner-1") == []
+    assert dao.record_failures(101, [(order_id, "timeout")], lambda n: 30, 2, 4) == [order_id]
+    db.expire_all()
+    assert db.get(SelfStockOrder, order_id).order_status == 4
+
+
+def test_submit_sms_code_skips_claimed_orders_and_clears_backoff(db):
+    order_id = add_order(db, "A", status=1)
+    dao = SelfStockOrderDAO(db)
+    db.add(SelfStockOrderAttempt(order_id=order_id, order_status=201, attempts=1,
+                                 next_attempt_at=datetime.now() + timedelta(minutes=5), updated_at=datetime.now()))
+    db.commit()
+
+    order = dao.submit_sms_code("A", "1234", (1, 201), 201)
+    assert (order.sms_num, order.order_status) == ("1234", 201)
+    assert db.get(SelfStockOrderAttempt, (order_id, 201)) is None
+
+    assert dao.claim_orders(201, "hubei-dianxin", "owner-1")
+    assert dao.submit_sms_code("A", "5678", (1, 201), 201) is None
+
+
+def test_sms_code_stage_expires_from_sms_code_arrival(db):
+    # 下单很久后才收到验证码，提交阶段按验证码到达时间计算超时
+    order_id = add_order(db, "A", status=1, minutes_ago=120)
+    dao = SelfStockOrderDAO(db)
+    assert dao.submit_sms_code("A", "1234", (1,), 201)
+    an_hour_ago = datetime.now() - timedelta(hours=1)
+
+    assert dao.expire_orders(201, "hubei-dianxin", an_hour_ago, 5, "expired", expire_from="update_time") == 0
+    claimed = dao.claim_orders(201, "hubei-dianxin", "owner-1", expire_before=an_hour_ago, expire_from="update_time")
+    assert [o.order_id for o in claimed] == [order_id]
+    dao.release_claims([order_id], "owner-1")
+    # 按下单时间计算则已超时
+    assert dao.expire_orders(201, "hubei-dianxin", an_hour_ago, 5, "expired") == 1
@@ -0,0 +1,81 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+
+from app.Order.order_dao import SelfStockOrder, SelfStockOrderDAO
+from app.service import order_push_service
+from app.service.order_push_service import OrderPushService
+
+
+class FakeWorkerPool:
+    def __init__(self, slots=5):
+        self.slots = slots
+        self.submitted = []
+
+    def free_slots(self, supplier_code):
+        return self.slots
+
+    def try_submit(self, supplier_code, fn, order):
+        self.submitted.append(order.order_id)
+        return object()
+
+
+@pytest.fixture
+def service(monkeypatch, session_factory):
+    @contextmanager
+    def scope():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    monkeypatch.setattr(order_push_service, "session_scope", scope)
+    service = OrderPushService()
+    service.worker_pool = FakeWorkerPool()
+    service.is_running = True
+    return service
+
+
+def add_order(db, order_no):
+    order = SelfStockOrder(order_no=order_no, order_status=201, supplier_code="hubei-dianxin",
+                           order_time=datetime.now(), sms_num="1234")
+    db.add(order)
+    db.commit()
+    return order
+
+
+def test_sms_code_event_pushes_unclaimed_order(service, db):
+    order = add_order(db, "A")
+
+    assert service.on_sms_code(order) is True
+    assert service.worker_pool.submitted == [order.order_id]
+
+
+def test_sms_code_event_skips_order_already_claimed_by_poller(service, db):
+    order = add_order(db, "A")
+    # 轮询先认领并提交了订单，验证码事件随后到达
+    assert service.execute_task() == (1, 5)
+
+    assert service.on_sms_code(order) is False
+    assert service.worker_pool.submitted == [order.order_id]
+
+
+def test_poller_skips_order_already_claimed_by_sms_code_event(service, db):
+    order = add_order(db, "A")
+    assert service.on_sms_code(order) is True
+
+    assert service.execute_task() == (0, 5)
+    assert service.worker_pool.submitted == [order.order_id]
+
+
+def test_claim_limit_follows_free_worker_slots(service, db):
+    add_order(db, "A")
+    add_order(db, "B")
+    service.worker_pool.slots = 2
+
+    # 空闲线程只有 2 个，认领满 2 个即为满批
+    fetched, limit = service.execute_task()
+    assert (fetched, limit) == (2, 2)
+    assert service.poll_interval.next(fetched, limit) == service.poll_interval.min_interval
@@ -0,0 +1,62 @@
+import threading
+import time
+
+from app.service.product_scheduler import ProductRateScheduler
+
+
+def test_orders_within_product_follow_priority():
+    scheduler = ProductRateScheduler(default_interval=0, priority=lambda order: order["deadline"])
+    scheduler.add("G1", {"id": 1, "deadline": 30})
+    scheduler.add("G1", {"id": 2, "deadline": 10})
+    scheduler.add("G1", {"id": 3, "deadline": 20})
+
+    assert [scheduler.take(timeout=0)[1]["id"] for _ in range(3)] == [2, 3, 1]
+    assert scheduler.take(timeout=0) is None
+
+
+def test_same_product_waits_for_interval_other_products_do_not():
+    scheduler = ProductRateScheduler(default_interval=60, product_intervals={"G2": 0})
+    scheduler.add("G1", "a")
+    scheduler.add("G1", "b")
+    scheduler.add("G2", "c")
+    scheduler.add("G2", "d")
+
+    taken = [scheduler.take(timeout=0) for _ in range(4)]
+    assert sorted(t for t in taken if t) == [("G1", "a"), ("G2", "c"), ("G2", "d")]
+    assert scheduler.sizes() == {"G1": 1}
+    assert scheduler.next_at("G1") > time.time() + 50
+
+
+def test_restore_keeps_future_deadlines_only():
+    scheduler = ProductRateScheduler(default_interval=0)
+    scheduler.add("G1", "a")
+    scheduler.add("G2", "b")
+    scheduler.restore({"G1": time.time() + 60, "G2": time.time() - 60})
+
+    assert scheduler.take(timeout=0) == ("G2", "b")
+    assert scheduler.take(timeout=0) is None
+    assert scheduler.next_at("G1") > time.time()
+
+
+def test_remove_where_keeps_rate_limit_and_queue_order():
+    scheduler = ProductRateScheduler(default_interval=0, priority=lambda order: order)
+    for order in (5, 1, 4, 2):
+        scheduler.add("G1", order)
+    scheduler.add("G2", 3)
+
+    removed = scheduler.remove_where(lambda order: order in (1, 3))
+    assert sorted(removed) == [1, 3]
+    assert scheduler.sizes() == {"G1": 3}
+    assert [scheduler.take(timeout=0)[1] for _ in range(3)] == [2, 4, 5]
+    assert len(scheduler) == 0
+
+
+def test_interrupt_wakes_blocked_take():
+    scheduler = ProductRateScheduler(default_interval=0)
+    scheduler.add("G1", "a")
+    scheduler.restore({"G1": time.time() + 60})
+    threading.Timer(0.1, scheduler.interrupt).start()
+    started = time.time()
+
+    assert scheduler.take() is None
+    assert time.time() - started < 5
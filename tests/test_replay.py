@@ -0,0 +1,115 @@
+import requests
+
+from app.rpa.context import OrderContext
+from app.rpa.network_dispatcher import CapturedResponse
+from app.rpa.replay import REPLAY_SMS, ReplayClient, ReplayTemplate
+from app.rpa.request import PlaceOrderRequest
+
+OPEN_URL = "https://shop.example.com/order?goods=G1001&token=abcdef"
+
+
+def make_ctx(order_id, phone, sms_code="", open_url=OPEN_URL):
+    return OrderContext(PlaceOrderRequest(open_url=open_url, phone=phone, sms_code=sms_code, order_id=order_id))
+
+
+def captured(body, url="https://shop.example.com/random.action?token=abcdef"):
+    return CapturedResponse(url, "POST", None, headers={"User-Agent": "UA", "Cookie": "a=1", "Host": "x"},
+                            raw_post_data=body)
+
+
+def test_render_substitutes_order_values():
+    template = ReplayTemplate(captured("phone=13800000000&code=5566"), make_ctx("A", "13800000000", "5566"))
+
+    url, body = template.render(make_ctx("B", "13900000000", "7788", OPEN_URL.replace("abcdef", "zyxwvu")),
+                                required=("phone", "sms_code"))
+    assert body == "phone=13900000000&code=7788"
+    assert url.endswith("token=zyxwvu")
+
+
+def test_render_handles_url_encoded_values():
+    template = ReplayTemplate(captured("mobile=%2B8613800000000"), make_ctx("A", "+8613800000000"))
+
+    assert template.render(make_ctx("B", "+8613900000000")) == (template.url, "mobile=%2B8613900000000")
+
+
+def test_render_refuses_when_required_value_missing():
+    # 请求体被加密，找不到手机号
+    template = ReplayTemplate(captured("data=ZW5jcnlwdGVk"), make_ctx("A", "13800000000"))
+    assert template.render(make_ctx("B", "13900000000")) is None
+    # 新订单没有验证码
+    template = ReplayTemplate(captured("phone=13800000000&code=5566"), make_ctx("A", "13800000000", "5566"))
+    assert template.render(make_ctx("B", "13900000000"), required=("phone", "sms_code")) is None
+
+
+def test_template_drops_generated_headers():
+    template = ReplayTemplate(captured("phone=13800000000"), make_ctx("A", "13800000000"))
+    assert template.headers == {"User-Agent": "UA"}
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, text='{"flag": "0"}', cookies=None, history=()):
+        self.status_code = status_code
+        self.text = text
+        self.cookies = requests.cookies.cookiejar_from_dict(cookies or {})
+        self.history = list(history)
+
+
+class FakeSession:
+    def __init__(self, warmup_cookies):
+        self.warmup_cookies = list(warmup_cookies)
+        self.sent_cookies = []
+
+    def get(self, url, cookies=None, timeout=None, headers=None):
+        return FakeResponse(cookies=self.warmup_cookies.pop(0))
+
+    def request(self, method, url, data=None, headers=None, cookies=None, timeout=None):
+        self.sent_cookies.append(dict(cookies))
+        return FakeResponse()
+
+
+def test_each_order_starts_its_own_session():
+    client = ReplayClient("test")
+    client.session = FakeSession([{"sid": "order-b"}, {"sid": "order-c"}])
+    client.harvest(REPLAY_SMS, make_ctx("A", "13800000000"), captured("phone=13800000000"))
+
+    assert client.replay(REPLAY_SMS, make_ctx("B", "13900000000")).body == {"flag": "0"}
+    assert client.replay(REPLAY_SMS, make_ctx("C", "13700000000")) is not None
+    assert client.session.sent_cookies == [{"sid": "order-b"}, {"sid": "order-c"}]
+    assert client.order_cookies("B") == [{"name": "sid", "value": "order-b", "domain": "", "path": "/"}]
+
+
+def test_replay_falls_back_when_session_cannot_start():
+    client = ReplayClient("test")
+    client.session = FakeSession([])
+    client.session.get = lambda *args, **kwargs: FakeResponse(status_code=502)
+    client.harvest(REPLAY_SMS, make_ctx("A", "13800000000"), captured("phone=13800000000"))
+
+    assert client.replay(REPLAY_SMS, make_ctx("B", "13900000000")) is None
+    assert not client.has_session("B")
+
+
+def weidian_with_replay_result(monkeypatch, body):
+    from app.rpa.strategies.weidian_page_strategy import WeiDianPageStrategy
+
+    strategy = object.__new__(WeiDianPageStrategy)
+    closed = []
+    monkeypatch.setattr(strategy, "replay_stage", lambda ctx, stage, required=("phone",): CapturedResponse(
+        "https://shop.example.com/gborderNew.action", "POST", None, status=200, body=body), raising=False)
+    monkeypatch.setattr(strategy, "close_order_tab", closed.append, raising=False)
+    return strategy, closed
+
+
+def test_weidian_business_rejection_is_the_order_result(monkeypatch):
+    strategy, closed = weidian_with_replay_result(monkeypatch, {"flag": False, "msg": "验证码错误"})
+
+    result = strategy.replay_submit_order(make_ctx("B", "13900000000", "7788"))
+    assert result["code"] == 500
+    assert closed == ["B"]
+
+
+def test_weidian_unexpected_response_falls_back_to_browser(monkeypatch):
+    strategy, closed = weidian_with_replay_result(monkeypatch, "<html>login</html>")
+
+    assert strategy.replay_submit_order(make_ctx("B", "13900000000", "7788")) is None
+    assert strategy.replay_verification_code(make_ctx("B", "13900000000")) is None
+    assert closed == []
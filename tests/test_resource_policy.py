@@ -0,0 +1,41 @@
+from app.rpa.resource_policy import ResourcePolicy
+
+
+class FakeTab:
+    def __init__(self):
+        self.calls = []
+
+    def run_cdp(self, method, **kwargs):
+        self.calls.append(method)
+
+
+def paused(url, resource_type):
+    return {'requestId': '1', 'request': {'url': url}, 'resourceType': resource_type}
+
+
+def test_third_party_scripts_blocked_first_party_allowed():
+    policy = ResourcePolicy(first_party_hosts=('189.cn',))
+
+    assert policy.allows('https://h5.189.cn/app.js', 'Script')
+    assert not policy.allows('https://cdn.example.com/app.js', 'Script')
+    assert policy.allows('https://cdn.example.com/api', 'XHR')
+    assert not policy.allows('https://h5.189.cn/logo.png', 'Image')
+    assert not policy.allows('https://hm.baidu.com/hm.js', 'XHR')
+
+
+def test_without_first_party_hosts_scripts_are_not_paused():
+    patterns = ResourcePolicy()._fetch_patterns()
+    assert {p.get('resourceType') for p in patterns} == {'Image', 'Media', 'Font', None}
+
+
+def test_stats_count_paused_requests():
+    policy = ResourcePolicy(first_party_hosts=('189.cn',))
+    tab = FakeTab()
+
+    policy._on_paused(tab, paused('https://h5.189.cn/app.js', 'Script'))
+    policy._on_paused(tab, paused('https://cdn.example.com/app.js', 'Script'))
+
+    assert tab.calls == ['Fetch.continueRequest', 'Fetch.failRequest']
+    stats = policy.stats()
+    assert (stats['paused'], stats['blocked'], stats['continued']) == (2, 1, 1)
+    assert stats['max_continue_ms'] >= stats['avg_continue_ms'] >= 0
@@ -0,0 +1,39 @@
+import time
+from types import SimpleNamespace
+
+from app.service import scheduler_state
+from app.service.scheduler_state import SchedulerStateStore
+
+
+def test_state_dir_defaults_to_app_data_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path))
+    monkeypatch.setenv("LOCALAPPDATA", str(tmp_path))
+    assert scheduler_state.app_data_dir() == str(tmp_path)
+
+
+def test_default_state_path_creates_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(scheduler_state, "STATE_DIR", str(tmp_path / "state"))
+
+    path = scheduler_state.default_state_path("weidian.db")
+    assert path == str(tmp_path / "state" / "weidian.db")
+    assert (tmp_path / "state").is_dir()
+
+
+def test_state_survives_reopen(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = SchedulerStateStore(path)
+    next_at = time.time() + 60
+    store.set_owner("owner-1")
+    store.save_next_at("G1", next_at)
+    store.save_next_at("G2", time.time() - 1)
+    store.add_order(SimpleNamespace(order_id=1, goods_code="G1", order_no="A"))
+    store.add_order(SimpleNamespace(order_id=2, goods_code="G1", order_no="B"))
+    store.remove_orders([1])
+    store.close()
+
+    store = SchedulerStateStore(path)
+    assert store.get_owner() == "owner-1"
+    # 已过期的限流时间不再恢复
+    assert store.load_next_at() == {"G1": next_at}
+    assert store.load_queued_ids() == [2]
+    store.close()
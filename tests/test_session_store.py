@@ -0,0 +1,52 @@
+from app.rpa.session_store import EVICT_CAPACITY, EVICT_EXPIRED, OrderSession, SessionStore
+
+
+def make_store(**kwargs):
+    evicted = []
+    store = SessionStore(on_evict=lambda session, reason: evicted.append((session.order_id, reason)), **kwargs)
+    return store, evicted
+
+
+def test_capacity_evicts_least_recently_used():
+    store, evicted = make_store(max_sessions=2)
+    store.put(OrderSession("A", None, None))
+    store.put(OrderSession("B", None, None))
+    store.get("A")
+    store.put(OrderSession("C", None, None))
+
+    assert evicted == [("B", EVICT_CAPACITY)]
+    assert "A" in store and "C" in store
+
+
+def test_make_room_frees_one_slot():
+    store, evicted = make_store(max_sessions=2)
+    store.put(OrderSession("A", None, None))
+    store.put(OrderSession("B", None, None))
+    store.make_room()
+
+    assert evicted == [("A", EVICT_CAPACITY)]
+    assert len(store) == 1
+
+
+def test_expired_sessions_are_evicted_on_get_and_sweep():
+    store, evicted = make_store(ttl=60)
+    for order_id in ("A", "B", "C"):
+        store.put(OrderSession(order_id, None, None))
+    for order_id in ("A", "B"):
+        store._sessions[order_id].created_at -= 120
+
+    assert store.get("A") is None
+    assert store.sweep() == 1
+    assert evicted == [("A", EVICT_EXPIRED), ("B", EVICT_EXPIRED)]
+    assert len(store) == 1
+
+
+def test_pop_does_not_call_on_evict():
+    store, evicted = make_store()
+    store.put(OrderSession("A", None, "browser-1"))
+    store.put(OrderSession("B", None, "browser-2"))
+
+    assert store.pop("A").order_id == "A"
+    assert [s.order_id for s in store.pop_where(lambda s: s.browser == "browser-2")] == ["B"]
+    assert evicted == []
+    assert len(store) == 0
@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+
+from app.Order.order_dao import SelfStockOrder, SelfStockOrderClaim, SelfStockOrderDAO
+from app.service import status_writer as status_writer_module
+from app.service.retry_policy import RetryPolicy
+from app.service.status_writer import StatusWriter
+
+
+@pytest.fixture
+def writer(monkeypatch, session_factory):
+    @contextmanager
+    def scope():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    monkeypatch.setattr(status_writer_module, "session_scope", scope)
+    return StatusWriter(max_retries=2)
+
+
+def add_claimed_order(db, order_no, owner="owner-1"):
+    order = SelfStockOrder(order_no=order_no, order_status=101, supplier_code="weidian", order_time=datetime.now())
+    db.add(order)
+    db.commit()
+    db.add(SelfStockOrderClaim(order_id=order.order_id, owner=owner, claimed_at=datetime.now(),
+                               lease_expires_at=datetime.now()))
+    db.commit()
+    return order.order_id
+
+
+def status(db, order_id):
+    db.expire_all()
+    return db.get(SelfStockOrder, order_id).order_status
+
+
+def fail_for(monkeypatch, bad_id):
+    """bad_id 的状态写不进去，其他订单正常"""
+    original = SelfStockOrderDAO.update_order_statuses
+
+    def update_order_statuses(self, updates):
+        if any(order_id == bad_id for order_id, _, _ in updates):
+            raise RuntimeError("bad row")
+        return original(self, updates)
+
+    monkeypatch.setattr(SelfStockOrderDAO, "update_order_statuses", update_order_statuses)
+
+
+def test_flush_writes_statuses_then_releases_claims(writer, db):
+    done = add_claimed_order(db, "A")
+    failed = add_claimed_order(db, "B")
+    writer.write(done, 102, "ok", "owner-1")
+    writer.fail(failed, 101, "timeout", RetryPolicy(failed_status=4), "owner-1")
+    writer.flush()
+
+    assert status(db, done) == 102
+    assert db.get(SelfStockOrderClaim, done) is None
+    assert db.get(SelfStockOrderClaim, failed) is None
+
+
+def test_bad_row_does_not_block_the_batch(writer, db, monkeypatch):
+    good = add_claimed_order(db, "A")
+    bad = add_claimed_order(db, "B")
+    fail_for(monkeypatch, bad)
+    writer.write(good, 102, "ok", "owner-1")
+    writer.write(bad, 102, "ok", "owner-1")
+    writer.flush()
+
+    assert status(db, good) == 102
+    assert db.get(SelfStockOrderClaim, good) is None
+    # 状态没写进去的订单保留认领，放回缓冲区下次重试
+    assert db.get(SelfStockOrderClaim, bad) is not None
+    assert bad in writer._updates and good not in writer._updates
+
+
+def test_bad_row_is_dropped_after_max_retries(writer, db, monkeypatch):
+    bad = add_claimed_order(db, "A")
+    fail_for(monkeypatch, bad)
+    writer.write(bad, 102, "ok", "owner-1")
+    writer.flush()
+    writer.flush()
+
+    assert not writer._updates and not writer._releases and not writer._retries
+
+
+def test_database_outage_does_not_count_as_retry(writer, db, monkeypatch):
+    bad = add_claimed_order(db, "A")
+    fail_for(monkeypatch, bad)
+    monkeypatch.setattr(StatusWriter, "_database_available", staticmethod(lambda: False))
+    writer.write(bad, 102, "ok", "owner-1")
+    for _ in range(3):
+        writer.flush()
+
+    assert bad in writer._updates
+    assert writer._retries == {}